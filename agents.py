@@ -13,6 +13,7 @@ user_proxy = UserProxyAgent(
 )
 import os
 from dotenv import load_dotenv
+from llm_cache import autogen_cache_seed
 load_dotenv()
 
 config_list = [
@@ -22,7 +23,7 @@ config_list = [
 
 reviewer = AssistantAgent(
     name="Reviewer",
-    llm_config={"config_list": config_list, "cache_seed": None},
+    llm_config={"config_list": config_list, "cache_seed": autogen_cache_seed},
     system_message="""You are a Reviewer. You should review the top 5 related repos provided by `Writer` and select the one that best matches the user's algorithm requirements. 
     If any repo matches the task, return the repository name, analyse why it matches the requirements, and output `TERMINATE` to signal the completion of the task.
     If none of the repos matches the task, analyse why, ouput `WRITER REWRITE` and transfer to `Writer` to generate a more accurate README text.
@@ -37,7 +38,7 @@ reviewer = AssistantAgent(
 
 searcher = AssistantAgent(
     name="Searcher",
-    llm_config={"config_list": config_list, "cache_seed": None},
+    llm_config={"config_list": config_list, "cache_seed": autogen_cache_seed},
     system_message="""You are a Searcher. You need to understand the algorithm requirements provided by the user, interpreting the task code needed, 
     and determining the requirements for the code (such as the programming language, whether it can run on CPU/GPU, etc.). 
     Then you should generate 2 or 3 keywords to search the related repos from GitHub.
@@ -50,7 +51,7 @@ searcher = AssistantAgent(
 
 writer = AssistantAgent(
     name="Writer",
-    llm_config={"config_list": config_list, "cache_seed": None},
+    llm_config={"config_list": config_list, "cache_seed": autogen_cache_seed},
     system_message="""You are a Writer. Your task is to generate a README text that aligns as closely as possible with the user's specified algorithm requirements and search the top related repos. 
     The README must highlight and prioritize the user's specific needs, such as programming language, hardware compatibility (CPU/GPU), performance optimization, and any other explicit details provided in the algorithm description.
     And then, you should search the top related repos from the vector database and transfer to `Reviewer` to select the best one.
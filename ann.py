@@ -0,0 +1,206 @@
+import math
+import os
+
+import faiss
+import numpy as np
+
+import telemetry
+
+# 'auto' picks from corpus size; any of index_types forces one
+index_type = os.getenv('RAGC_INDEX_TYPE', 'auto')
+index_types = ('flat', 'hnsw', 'ivf_flat', 'ivf_sq8', 'ivf_pq')
+
+# corpus sizes where auto selection moves to the next index type
+hnsw_above = 20000
+ivf_above = 200000
+sq8_above = 1000000
+pq_above = 5000000
+
+default_nprobe = 16
+default_ef_search = 64
+# vectors an 8-bit PQ codebook (and a k-means coarse quantizer at our nlist) needs to train
+min_train_vectors = 256
+# a filtered search over a view of at most this many rows of an HNSW/IVF index is done exactly on the
+# raw vectors: a selective filter leaves the graph walk or the probed lists with too few allowed hits
+exact_view_rows = 50000
+
+
+def can_train(kind, n):
+    """Whether `n` vectors are enough to train an index of `kind` (flat and HNSW need no training)."""
+    return not kind.startswith('ivf') or n >= max(min_train_vectors, choose_nlist(n))
+
+
+def choose_index_type(n):
+    if index_type != 'auto':
+        # a forced IVF type starts flat and is trained once the store is big enough (see needs_rebuild)
+        return index_type if can_train(index_type, n) else 'flat'
+    if n < hnsw_above:
+        return 'flat'
+    if n < ivf_above:
+        return 'hnsw'
+    if n < sq8_above:
+        return 'ivf_flat'
+    if n < pq_above:
+        return 'ivf_sq8'
+    return 'ivf_pq'
+
+
+def choose_nlist(n):
+    return int(min(max(4 * math.sqrt(n), 64), 65536))
+
+
+def index_kind(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return 'ivf_sq8'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'ivf_flat'
+    return 'flat'
+
+
+def new_index(d, kind='flat', n=0):
+    """Untrained, empty index of `kind` for `n` vectors of dimension `d`."""
+    if kind == 'flat':
+        return faiss.IndexFlatL2(d)
+    if kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = default_ef_search
+        return index
+    nlist = choose_nlist(n)
+    if kind == 'ivf_flat':
+        index = faiss.index_factory(d, f'IVF{nlist},Flat')
+    elif kind == 'ivf_sq8':
+        index = faiss.index_factory(d, f'IVF{nlist},SQ8')
+    elif kind == 'ivf_pq':
+        # 8-bit codes over sub-vectors of 16 dims (1536-d OpenAI vectors -> 96 bytes each)
+        m = max(d // 16, 1)
+        while d % m:
+            m -= 1
+        index = faiss.index_factory(d, f'IVF{nlist},PQ{m}x8')
+    else:
+        raise ValueError(f"unknown index type {kind!r}, expected one of {index_types}")
+    faiss.extract_index_ivf(index).nprobe = default_nprobe
+    return index
+
+
+def build_index(vectors, kind=None):
+    """Train (if needed) and fill an index of `kind` (default: chosen from size) with `vectors`.
+
+    Too few vectors to train `kind` give a flat index instead.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    kind = kind or choose_index_type(n)
+    if not can_train(kind, n):
+        print(f"{n} vectors are too few to train {kind}, using flat")
+        kind = 'flat'
+    index = new_index(d, kind, n)
+    if not index.is_trained:
+        # faiss k-means uses at most 256 points per centroid; sample to bound training time
+        train_size = min(n, 256 * choose_nlist(n))
+        sample = vectors[np.random.default_rng(0).choice(n, train_size, replace=False)] if train_size < n else vectors
+        index.train(sample)
+    for start in range(0, n, 65536):
+        index.add(vectors[start:start + 65536])
+    return index
+
+
+def needs_rebuild(index):
+    kind = index_kind(index)
+    wanted = choose_index_type(index.ntotal)
+    if kind != wanted:
+        return True
+    if kind.startswith('ivf'):
+        # IVF lists get long as the corpus outgrows the nlist it was trained for
+        return choose_nlist(index.ntotal) >= 2 * faiss.extract_index_ivf(index).nlist
+    return False
+
+
+def rebuild_index(db, kind=None):
+    """Replace the index of `db` with a freshly trained one built from its raw embeddings.
+
+    Positions (and so `index_to_docstore_id`) are unchanged because vectors
+    are re-added in the same order.
+    """
+    from store import raw_vectors
+
+    chunks = raw_vectors(db)
+    vectors = np.concatenate(chunks) if chunks else np.zeros((0, db.index.d), dtype=np.float32)
+    kind = kind or choose_index_type(len(vectors))
+    print(f"Rebuilding {index_kind(db.index)} index of {len(vectors)} vectors as {kind}")
+    with telemetry.span('index.rebuild', vectors=len(vectors), kind=kind):
+        db.index = build_index(vectors, kind) if len(vectors) else new_index(db.index.d)
+    return db
+
+
+def maybe_rebuild(db):
+    if needs_rebuild(db.index):
+        rebuild_index(db)
+    return db
+
+
+def estimated_bytes(index):
+    """Rough resident size of `index` in bytes."""
+    kind = index_kind(index)
+    n, d = index.ntotal, index.d
+    if kind == 'flat':
+        return n * d * 4
+    if kind == 'hnsw':
+        # vectors plus ~2*M neighbour ids on the base level
+        return n * (d * 4 + 64 * 4)
+    ivf = faiss.extract_index_ivf(index)
+    return ivf.nlist * d * 4 + n * (ivf.code_size + 8)
+
+
+def _scaled(value, selectivity, limit):
+    # a filter passing a `selectivity` fraction of the rows needs ~1/selectivity times the candidates
+    if not selectivity or selectivity >= 1:
+        return value
+    return int(min(max(value, math.ceil(value / selectivity)), max(limit, value)))
+
+
+def search_parameters(index, selector=None, nprobe=None, ef_search=None, selectivity=None):
+    """Per-query SearchParameters for `index`, or None when nothing overrides the defaults.
+
+    With a `selector` passing a `selectivity` fraction of the rows, the
+    default efSearch / nprobe are scaled up by 1/selectivity (up to the whole
+    index) so the filtered search still sees enough allowed candidates;
+    explicit `ef_search` / `nprobe` are used as given.
+    """
+    kind = index_kind(index)
+    if kind == 'hnsw' and (selector is not None or ef_search):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or _scaled(faiss.downcast_index(index).hnsw.efSearch, selectivity, index.ntotal)
+    elif kind.startswith('ivf') and (selector is not None or nprobe):
+        ivf = faiss.extract_index_ivf(index)
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or _scaled(ivf.nprobe, selectivity, ivf.nlist)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def search_rows(vectors, rows, metric_type, k):
+    """Exact top `k` of each query in `vectors` among `rows`, as (distances, row numbers) like `index.search`."""
+    k = min(k, len(rows))
+    if not k:
+        return np.zeros((len(vectors), 0), dtype=np.float32), np.zeros((len(vectors), 0), dtype=np.int64)
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        distances = vectors @ rows.T
+        key = -distances
+    else:
+        # squared L2, as FAISS reports it
+        distances = (vectors ** 2).sum(1)[:, None] - 2 * vectors @ rows.T + (rows ** 2).sum(1)[None, :]
+        key = distances
+    top = np.argpartition(key, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(top, np.argsort(np.take_along_axis(key, top, axis=1), axis=1), axis=1)
+    return np.take_along_axis(distances, top, axis=1).astype(np.float32), top.astype(np.int64)
@@ -5,13 +5,14 @@ from autogen import (
 )
 from autogen.cache import Cache
 from agents import user_proxy, searcher, reviewer, writer, config_list
+from llm_cache import autogen_cache_seed
 from tools import download_readme_to_db, search_db
 
 register_function(
     search_db,
     caller=writer,
     executor=writer,
-    description="Search with the text from a vector db loaded from db_path, and return the descriptions and readme of top related repos"
+    description="Search with the text from a vector db loaded from db_path, and return the descriptions and readme of top related repos. Pass a list of README variants as text to search them all in one call"
 )
 register_function(
     download_readme_to_db,
@@ -35,7 +36,7 @@ groupchat = GroupChat(
 )
 manager = GroupChatManager(
     groupchat=groupchat, 
-    llm_config={"config_list": config_list, "cache_seed": None},
+    llm_config={"config_list": config_list, "cache_seed": autogen_cache_seed},
     is_termination_msg=lambda x: x.get("content", "") and x.get("content", "").rstrip().endswith("TERMINATE"),
     code_execution_config=False,
     )
@@ -45,10 +46,14 @@ if __name__ == "__main__":
     Provide the most relevant GitHub repository about the following title and abstract: We present a novel algorithm that uses exact learning and abstraction to extract a deterministic finite automaton describing the state dynamics of a given trained RNN. We do this using Angluin's L* algorithm as a learner and the trained RNN as an oracle. Our technique efficiently extracts accurate automata from trained RNNs, even when the state vectors are large and require fine differentiation.
 
     """
-    with Cache.disk(cache_seed=41) as cache:
-        chat_history = user_proxy.initiate_chat(
-        manager,
-        message=task,
-        cache=cache,
-    )
+    if autogen_cache_seed is None:
+        # RAGC_LLM_CACHE=off: no autogen disk cache either
+        chat_history = user_proxy.initiate_chat(manager, message=task)
+    else:
+        with Cache.disk(cache_seed=autogen_cache_seed) as cache:
+            chat_history = user_proxy.initiate_chat(
+            manager,
+            message=task,
+            cache=cache,
+        )
     print(chat_history)
\ No newline at end of file
@@ -1,25 +1,21 @@
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
+from llm_cache import CachedLLM
 from dotenv import load_dotenv
 import os
-from langchain_community.vectorstores import FAISS
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_openai import OpenAIEmbeddings
-from search import search_github
-from download import load_readme, clone_github_repo
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from search import iter_github, search_db, max_pages
+from download import init_db, load_readme, clone_github_repo, embeddings
+from store import open_store, save_store, merge_stores
+from catalog import get_catalog
 load_dotenv()
 
 openai_key = os.getenv('OPENAI_API_KEY')
 
-embeddings = OpenAIEmbeddings()
-llm = ChatOpenAI(
+llm = CachedLLM(ChatOpenAI(
         api_key=openai_key,
         model='gpt-3.5-turbo-0125',
         max_tokens='32'
-    )
+    ))
 
 def run(code_description):
     print("Generating query keywords...")
@@ -31,27 +27,18 @@ def run(code_description):
     # 2. 判断有无缓存
     db_path = check_local(keywords)
     if db_path:
-        vector_store = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+        vector_store = open_store(db_path, embeddings)
     else:
     # 3. 返回仓库列表
-        repos = search_github(keywords, 1)
-    # 4. 下载所有仓库readme到数据库
-        vector_store = FAISS(
-                        embedding_function=embeddings,
-                        index=faiss.IndexFlatL2(len(embeddings.embed_query("hello world"))),
-                        docstore=InMemoryDocstore(),
-                        index_to_docstore_id={},
-                    )
-        load_readme(repos, vector_store)
+        repos = iter_github(keywords, max_pages)
+    # 4. 下载所有仓库readme到数据库（边搜索边下载）
+        vector_store = init_db()
+        stats = load_readme(repos, vector_store)
         db_file_name = '-'.join(keywords).lower()
-        vector_store.save_local(f'./db/{db_file_name}')
+        save_store(vector_store, f'./db/{db_file_name}')
+        get_catalog().register(keywords, f'./db/{db_file_name}', stats['repos'])
     # 5. 检索最相似的仓库
-    bm25_retriever = BM25Retriever.from_documents(vector_store.docstore._dict.values())
-    faiss_retriever = vector_store.as_retriever()
-    ensemble_retriever = EnsembleRetriever(
-        retrievers=[bm25_retriever, faiss_retriever], weights=[0.8, 0.2]
-    )
-    similar_repo = ensemble_retriever.invoke(code_description)
+    similar_repo = search_db(vector_store, code_description, weights=(0.8, 0.2))
     print(f"Best matching repository: {similar_repo}")
 
     # 6. 下载到本地
@@ -59,13 +46,26 @@ def run(code_description):
     # clone_github_repo(repo_name)
 
 def check_local(keywords):
-    folder_path = './db'
-    keywords = set(keywords)
-    for item in os.listdir(folder_path):
-        store_keywords = set(item.split('-'))
-        if store_keywords == keywords:
-            return os.path.join(folder_path, item)
-    return None
+    """Path of a store on disk that covers `keywords`, or None if GitHub has to be searched.
+
+    An exact or superset keyword set is used as is; if every keyword is
+    covered by some store, those stores are merged into a new one.
+    """
+    catalog = get_catalog()
+    match, entries = catalog.lookup(keywords)
+    if match is None:
+        return None
+    if match == 'union':
+        db_path = f"./db/{'-'.join(sorted(keywords))}"
+        try:
+            merged = merge_stores([entry['path'] for entry in entries], db_path, embeddings)
+        except ValueError as e:
+            # the covering stores are all empty, search GitHub instead
+            print(e)
+            return None
+        catalog.register(keywords, db_path, len({doc.metadata['repo_name'] for doc in merged.docstore._dict.values()}))
+        return db_path
+    return entries[0]['path']
 
 def get_query_keywords(function_description):
     prompt_template = PromptTemplate(
@@ -0,0 +1,224 @@
+"""Offline end-to-end benchmark: ingestion, search, tool calls and chain.run against local fakes.
+
+    python -m bench.e2e --sizes 100 1000 --concurrency 4 16 --out bench/results/e2e.json
+    python -m bench.e2e --baseline bench/results/e2e.json
+
+Everything runs in a temporary working directory against `FakeGithub`,
+`FakeEmbeddings` and `FakeChatModel`, so no network access or API keys are
+needed and runs are comparable over time.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# the pipeline modules live at the repo root, next to this package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_github import FakeGithub
+from bench.fakes import FakeChatModel, FakeEmbeddings, descriptions, make_repos, topics
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+    return {
+        'n': len(values),
+        'mean': sum(values) / len(values),
+        'p50': pick(0.5),
+        'p90': pick(0.9),
+        'p99': pick(0.99),
+        'max': values[-1],
+    }
+
+
+def memory():
+    with open('/proc/self/statm') as f:
+        rss_pages = int(f.read().split()[1])
+    return {
+        'rss_mb': rss_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def timed_calls(fn, args, concurrency):
+    """Call `fn(arg)` for every arg on `concurrency` threads; returns (results, latencies, wall seconds)."""
+    latencies = []
+
+    def call(arg):
+        start = time.perf_counter()
+        result = fn(arg)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, args))
+    return results, latencies, time.perf_counter() - start
+
+
+class Bench:
+    """Fakes wired into the pipeline modules, which are imported only after the fakes exist."""
+
+    def __init__(self, workdir, max_repos, gh_latency, embed_latency, llm_latency, search_limit):
+        os.chdir(workdir)
+        self.workdir = workdir
+        self.repos = make_repos(max_repos)
+        self.github = FakeGithub(self.repos, latency=gh_latency, search_limit=search_limit).__enter__()
+        os.environ['GH_API_URL'] = self.github.url
+        os.environ['GH_TOKEN'] = 'bench'
+        os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+        os.environ['RAGC_STORE_CACHE_BYTES'] = str(2 ** 30)
+
+        import embedding_cache
+        self.embeddings = FakeEmbeddings(latency=embed_latency)
+        embedding_cache._default = embedding_cache.CachedEmbeddings(self.embeddings, path=os.path.join(workdir, 'cache', 'embeddings.sqlite'))
+        import chain
+        import corpus
+        import download
+        import search
+        import tools
+        from gh_async import RepoInfo
+        from llm_cache import CachedLLM
+        self.chain, self.corpus, self.download, self.search, self.tools = chain, corpus, download, search, tools
+        self.RepoInfo = RepoInfo
+        self.llm = FakeChatModel(latency=llm_latency)
+        # bypass: every run pays the model latency, like a cold cache
+        chain.llm = CachedLLM(self.llm, path=os.path.join(workdir, 'cache', 'llm.sqlite'), bypass=True)
+
+    def close(self):
+        self.github.__exit__()
+
+    def fresh_embeddings_cache(self, name):
+        import embedding_cache
+        return embedding_cache.CachedEmbeddings(self.embeddings, path=os.path.join(self.workdir, 'cache', f'embeddings-{name}.sqlite'))
+
+    def ingest(self, size, concurrency, mode):
+        db = self.download.init_db()
+        db.embedding_function = self.fresh_embeddings_cache(f'ingest-{size}-{concurrency}-{mode}')
+        if mode == 'async':
+            repos = [self.RepoInfo(r['full_name'], r['description'], r['stargazers_count']) for r in self.repos[:size]]
+        else:
+            repos = [self.search.g.get_repo(r['full_name'], lazy=True) for r in self.repos[:size]]
+        before = memory()
+        start = time.perf_counter()
+        stats = self.download.load_readme(repos, db, workers=concurrency, use_async=mode == 'async')
+        seconds = time.perf_counter() - start
+        return db, {
+            'seconds': seconds,
+            'repos_per_second': size / seconds,
+            'docs': stats['docs'],
+            'docs_per_second': stats['docs'] / seconds,
+            'tokens_per_repo': stats['tokens_per_repo'],
+            'batch_latency': percentiles(stats['batch_latency']),
+            'memory': memory(),
+            'rss_growth_mb': memory()['rss_mb'] - before['rss_mb'],
+        }
+
+    def search_db(self, db, queries, concurrency):
+        _, latencies, wall = timed_calls(lambda query: self.search.search_db(db, query, k=5), queries, concurrency)
+        return {'latency': percentiles(latencies), 'qps': len(queries) / wall, 'memory': memory()}
+
+    def tool_calls(self, n, concurrency):
+        keywords = [[topic] for topic in topics[:n]]
+        paths, download_latencies, download_wall = timed_calls(self.tools.download_readme_to_db, keywords, concurrency)
+        texts = [f'A fast {keyword[0]} implementation' for keyword in keywords]
+        _, search_latencies, search_wall = timed_calls(lambda item: self.tools.search_db(*item, k=5), list(zip(paths, texts)), concurrency)
+        return {
+            'download_readme_to_db': percentiles(download_latencies),
+            'search_db': percentiles(search_latencies),
+            'seconds': download_wall + search_wall,
+            'memory': memory(),
+        }
+
+    def chain_run(self, n, concurrency):
+        self.corpus._corpus = self.corpus.Corpus(path=os.path.join(self.workdir, 'db', f'_corpus-{n}-{concurrency}'))
+        calls = self.llm.calls
+        results, latencies, wall = timed_calls(self.chain.run, descriptions(n), concurrency)
+        return {
+            'latency': percentiles(latencies),
+            'queries_per_minute': n / wall * 60,
+            'llm_calls': self.llm.calls - calls,
+            'found': sum(bool(result and result['result']) for result in results),
+            'memory': memory(),
+        }
+
+
+def compare(results, baseline):
+    """Print the relative change of every numeric metric against `baseline`."""
+    def flatten(d, prefix=''):
+        for key, value in d.items():
+            if isinstance(value, dict):
+                yield from flatten(value, f'{prefix}{key}.')
+            elif isinstance(value, (int, float)):
+                yield f'{prefix}{key}', value
+    old = dict(flatten(baseline['scenarios']))
+    for name, value in flatten(results['scenarios']):
+        if name in old and old[name]:
+            print(f'{name:80s} {old[name]:12.4g} -> {value:12.4g} ({(value - old[name]) / old[name]:+.1%})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', default=['ingest', 'search', 'tools', 'chain'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[4, 16])
+    parser.add_argument('--modes', nargs='+', default=['threads', 'async'])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--chain-runs', type=int, default=20)
+    parser.add_argument('--gh-latency', type=float, default=0.02)
+    parser.add_argument('--embed-latency', type=float, default=0.05)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--search-limit', type=int, default=1000, help='fake search requests per minute')
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--baseline', default=None)
+    args = parser.parse_args()
+
+    root = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='ragc-bench-')
+    bench = Bench(workdir, max(args.sizes), args.gh_latency, args.embed_latency, args.llm_latency, args.search_limit)
+    results = {'args': vars(args), 'started': time.time(), 'scenarios': {}}
+    scenarios = results['scenarios']
+    try:
+        dbs = {}
+        for size in args.sizes:
+            for concurrency in args.concurrency:
+                for mode in args.modes:
+                    if 'ingest' in args.scenarios or size not in dbs:
+                        db, stats = bench.ingest(size, concurrency, mode)
+                        dbs[size] = db
+                        if 'ingest' in args.scenarios:
+                            scenarios[f'ingest/{mode}/n={size}/c={concurrency}'] = stats
+                if 'search' in args.scenarios:
+                    queries = [f'{topics[i % len(topics)]} fast implementation {i}' for i in range(args.queries)]
+                    scenarios[f'search_db/n={size}/c={concurrency}'] = bench.search_db(dbs[size], queries, concurrency)
+        for concurrency in args.concurrency:
+            if 'tools' in args.scenarios:
+                scenarios[f'tools/c={concurrency}'] = bench.tool_calls(min(len(topics), 8), concurrency)
+            if 'chain' in args.scenarios:
+                scenarios[f'chain.run/c={concurrency}'] = bench.chain_run(args.chain_runs, concurrency)
+        results['github_requests'] = bench.github.requests
+    finally:
+        bench.close()
+        os.chdir(root)
+
+    for name, stats in scenarios.items():
+        print(name, json.dumps(stats, default=float))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Local stand-in for the GitHub REST endpoints ragc uses, serving fixtures from `fakes.make_repos`."""
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGithub:
+    """GitHub search, repo, README and rate-limit endpoints on 127.0.0.1.
+
+    Every response carries `X-RateLimit-*` headers from per-resource buckets
+    of `core_limit`/`search_limit` requests per window; an empty bucket
+    answers 403 until the window resets, like the real API. `latency` is
+    added to every request. Repo and README responses carry an `ETag`; a
+    matching `If-None-Match` is answered 304 without spending from the bucket.
+    """
+
+    def __init__(self, repos, latency=0.02, core_limit=5000, search_limit=30, core_window=3600, search_window=60):
+        self.repos = {repo['full_name']: repo for repo in repos}
+        self.by_stars = sorted(repos, key=lambda repo: repo['stargazers_count'], reverse=True)
+        self.latency = latency
+        self.limits = {'core': (core_limit, core_window), 'search': (search_limit, search_window)}
+        self.buckets = {}
+        self.requests = {'core': 0, 'search': 0, 'limited': 0, 'not_modified': 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _take(self, resource, spend=True):
+        """Spend one request from `resource` (or just look, without `spend`); returns (allowed, headers)."""
+        limit, window = self.limits[resource]
+        now = time.time()
+        with self._lock:
+            remaining, reset = self.buckets.get(resource, (limit, now + window))
+            if now >= reset:
+                remaining, reset = limit, now + window
+            allowed = remaining > 0 or not spend
+            if not spend:
+                self.requests['not_modified'] += 1
+            elif allowed:
+                remaining -= 1
+                self.requests[resource] += 1
+            else:
+                self.requests['limited'] += 1
+            self.buckets[resource] = (remaining, reset)
+        return allowed, {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(int(reset)),
+            'X-RateLimit-Resource': resource,
+        }
+
+    def _repo_json(self, repo):
+        owner, name = repo['full_name'].split('/')
+        return {
+            'id': abs(hash(repo['full_name'])) % 10 ** 9,
+            'name': name,
+            'full_name': repo['full_name'],
+            'owner': {'login': owner},
+            'description': repo['description'],
+            'stargazers_count': repo['stargazers_count'],
+            'language': repo['language'],
+            'pushed_at': repo['pushed_at'],
+            'url': f"{self.url}/repos/{repo['full_name']}",
+            'html_url': f"https://github.com/{repo['full_name']}",
+        }
+
+    def _readme_body(self, repo, accept):
+        if 'raw' in accept:
+            return repo['readme']
+        return {
+            'type': 'file',
+            'encoding': 'base64',
+            'name': 'README.md',
+            'path': 'README.md',
+            'content': base64.b64encode(repo['readme'].encode('utf-8')).decode('ascii'),
+            'url': f"{self.url}/repos/{repo['full_name']}/contents/README.md",
+        }
+
+    def etag(self, repo, rest, accept):
+        """ETag of the repo or README response for `repo`; None for other endpoints."""
+        if rest == ['readme']:
+            body = self._readme_body(repo, accept)
+        elif not rest:
+            body = self._repo_json(repo)
+        else:
+            return None
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+        return f'"{hashlib.sha1(data).hexdigest()}"'
+
+    def search(self, query):
+        terms = set(query.lower().replace('-', ' ').split())
+        return [repo for repo in self.by_stars if terms & set(repo['topic'].split())]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers, content_type='application/json'):
+                data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_not_modified(self, headers, etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+            def do_GET(self):
+                time.sleep(fake.latency)
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                parts = [part for part in url.path.split('/') if part]
+                resource = 'search' if parts[:1] == ['search'] else 'core'
+                if parts == ['rate_limit']:
+                    # does not count against the limit on GitHub either
+                    self._send(200, {'resources': {}}, {})
+                    return
+                repo = fake.repos.get('/'.join(parts[1:3])) if parts[:1] == ['repos'] else None
+                etag = self.headers.get('If-None-Match')
+                if repo is not None and etag and etag == fake.etag(repo, parts[3:], self.headers.get('Accept', '')):
+                    # conditional requests answered 304 do not count against the rate limit
+                    _, headers = fake._take(resource, spend=False)
+                    self._send_not_modified(headers, etag)
+                    return
+                allowed, headers = fake._take(resource)
+                if not allowed:
+                    self._send(403, {'message': 'API rate limit exceeded'}, headers)
+                    return
+                if parts == ['search', 'repositories']:
+                    matches = fake.search(params.get('q', ''))
+                    per_page = int(params.get('per_page', 30))
+                    page = int(params.get('page', 1))
+                    items = matches[(page - 1) * per_page:page * per_page] if page * per_page <= 1000 else []
+                    self._send(200, {
+                        'total_count': len(matches),
+                        'incomplete_results': False,
+                        'items': [fake._repo_json(repo) for repo in items],
+                    }, headers)
+                    return
+                if len(parts) >= 3 and parts[0] == 'repos':
+                    repo = fake.repos.get(f'{parts[1]}/{parts[2]}')
+                    if repo is None:
+                        self._send(404, {'message': 'Not Found'}, headers)
+                    elif parts[3:] == ['readme']:
+                        body = fake._readme_body(repo, self.headers.get('Accept', ''))
+                        content_type = 'text/plain; charset=utf-8' if isinstance(body, str) else 'application/json'
+                        headers['ETag'] = fake.etag(repo, parts[3:], self.headers.get('Accept', ''))
+                        self._send(200, body, headers, content_type=content_type)
+                    elif not parts[3:]:
+                        headers['ETag'] = fake.etag(repo, parts[3:], self.headers.get('Accept', ''))
+                        self._send(200, fake._repo_json(repo), headers)
+                    else:
+                        self._send(404, {'message': 'Not Found'}, headers)
+                    return
+                self._send(404, {'message': 'Not Found'}, headers)
+
+        return Handler
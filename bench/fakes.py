@@ -0,0 +1,134 @@
+"""Deterministic stand-ins for GitHub data, OpenAI embeddings and the chat model."""
+import hashlib
+import random
+import re
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+topics = [
+    'gaussian splatting', 'npu simulator', 'graph neural network', 'web server', 'image segmentation',
+    'speech recognition', 'key value store', 'ray tracer', 'automata extraction', 'reinforcement learning',
+    'sparse attention', 'point cloud', 'code search', 'mesh generation', 'time series forecasting',
+    'quantum circuit', 'video codec', 'text to speech', 'protein folding', 'database engine',
+]
+languages = ['Python', 'C++', 'CUDA', 'Rust', 'Go', 'Java']
+filler = (
+    'fast efficient scalable simple modular accurate implementation library framework toolkit training inference '
+    'benchmark dataset model kernel memory parallel distributed configurable pipeline evaluation visualization '
+    'support example tutorial research paper official unofficial pytorch tensorflow gpu cpu api plugin'
+).split()
+
+
+def make_repos(n, seed=0):
+    """`n` synthetic repos: dicts with full_name, description, stars, topic, language and README text."""
+    rng = random.Random(seed)
+    repos = []
+    for i in range(n):
+        topic = topics[i % len(topics)]
+        language = languages[rng.randrange(len(languages))]
+        words = int(min(max(rng.lognormvariate(6, 0.8), 60), 4000))
+        body = ' '.join(rng.choice(filler + topic.split()) for _ in range(words))
+        paragraphs = [body[j:j + 600] for j in range(0, len(body), 600)]
+        readme = '\n\n'.join([
+            f'# {topic.title()} {i}',
+            f'[![build](https://img.shields.io/badge/build-passing-green.svg)](https://ci/{i})',
+            f'A {topic} implementation written in {language}.',
+            *paragraphs,
+            '## Installation\n```bash\npip install -r requirements.txt\n```',
+            '## License\nMIT',
+        ])
+        repos.append({
+            'full_name': f'bench-{topic.replace(" ", "-")}/repo-{i}',
+            'description': f'{topic} in {language}',
+            'stargazers_count': rng.randrange(0, 50000),
+            'topic': topic,
+            'language': language,
+            'readme': readme,
+            'pushed_at': '2024-01-01T00:00:00Z',
+        })
+    return repos
+
+
+def descriptions(n, seed=0):
+    """User requirements in the style of chain.py's, one per topic in turn."""
+    rng = random.Random(seed)
+    return [
+        f"Your task is to search a {topics[i % len(topics)]} repository in github. "
+        f"The main language is {rng.choice(languages)}. It should be configurable through .yaml files."
+        for i in range(n)
+    ]
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors, so similar texts get similar embeddings, with OpenAI-like latency.
+
+    Each call sleeps `latency + per_text * len(texts)` seconds; at most
+    `concurrency` calls run at once, like a rate-limited API.
+    """
+
+    def __init__(self, dim=256, latency=0.05, per_text=0.0005, concurrency=8):
+        self.dim = dim
+        self.latency = latency
+        self.per_text = per_text
+        self.model = f'fake-embedding-{dim}'
+        self.calls = 0
+        self._sem = threading.Semaphore(concurrency)
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r'\w+', text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        with self._sem:
+            self.calls += 1
+            time.sleep(self.latency + self.per_text * len(texts))
+            return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel:
+    """Answers chain.py's keyword, query-text and review prompts deterministically after `latency` seconds."""
+
+    def __init__(self, latency=0.3, per_token=0.0):
+        self.model_name = 'fake-chat'
+        self.temperature = 0.0
+        self.max_tokens = 512
+        self.latency = latency
+        self.per_token = per_token
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt):
+        wanted = [topic for topic in topics if topic in prompt.lower()]
+        if 'generating keywords' in prompt:
+            return ', '.join(wanted[:2] or topics[:2])
+        if 'generating text for searching README' in prompt:
+            topic = wanted[0] if wanted else topics[0]
+            return f'# {topic.title()}\nA fast {topic} implementation with a configurable pipeline and examples.'
+        if 'README of the repo' in prompt:
+            requirement, readme = prompt.split('README of the repo:', 1)
+            topic = next((topic for topic in topics if topic in requirement.lower()), None)
+            return f"Analysis done.\n{topic is not None and topic in readme.lower()}"
+        return 'ok'
+
+    def invoke(self, prompt, **kwargs):
+        prompt = str(prompt)
+        content = self._answer(prompt)
+        input_tokens, output_tokens = len(prompt) // 4, len(content) // 4
+        time.sleep(self.latency + self.per_token * output_tokens)
+        with self._lock:
+            self.calls += 1
+        return AIMessage(
+            content=content,
+            usage_metadata={'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens},
+        )
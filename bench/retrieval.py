@@ -0,0 +1,229 @@
+"""Retrieval microbenchmark over synthetic README corpora, from 1k documents up to 1M.
+
+    python -m bench.retrieval --sizes 1000 10000 100000 --out bench/results/retrieval.json
+    python -m bench.retrieval --sizes 1000000 --kinds hnsw ivf_flat ivf_sq8 ivf_pq --dim 128
+
+For each size it times the store build (embedding lookup + FAISS + BM25
+append), the BM25 matrix build, save and mmap load, and then for every
+index configuration the index build, FAISS-only and fused hybrid query
+latency, recall@k against exact search and resident memory. The `view`
+entry of each index measures a hybrid search filtered to a random
+`--view-fraction` of the documents (a keyword view of the shared corpus)
+against the same filtered search on the flat index.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from bench.e2e import memory, percentiles
+from bench.fakes import filler, topics
+
+
+class LookupEmbeddings(Embeddings):
+    """Embeddings precomputed for every document and query text, so the benchmark measures retrieval only."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.vectors = {}
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors.get(text, np.zeros(self.dim, dtype=np.float32))
+
+
+def make_corpus(n, dim, seed=0, clusters=None):
+    """`n` short README-like texts and their embeddings: noisy points around one center per topic variant."""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(len(topics), int(np.sqrt(n)))
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    words = random.Random(seed)
+    texts = []
+    for i, label in enumerate(labels):
+        topic = topics[label % len(topics)]
+        body = ' '.join(words.choice(filler) for _ in range(40))
+        texts.append(f'{topic} variant {label} repo {i}: {body}')
+    return texts, vectors, centers, labels
+
+
+def make_queries(centers, q, seed=1):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(centers), q)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((q, centers.shape[1])).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f'{topics[label % len(topics)]} variant {label} query {i}' for i, label in enumerate(labels)]
+    return texts, vectors
+
+
+def recall(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def timeit(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench_size(n, args, workdir):
+    import ann
+    import store
+    from langchain_community.vectorstores import FAISS
+    from mmap_store import MmapDocstore
+    from search import hybrid_search
+
+    texts, vectors, centers, _ = make_corpus(n, args.dim)
+    query_texts, query_vectors = make_queries(centers, args.queries)
+    embeddings = LookupEmbeddings(args.dim)
+    embeddings.vectors.update(zip(texts, vectors))
+    embeddings.vectors.update(zip(query_texts, query_vectors))
+    result = {'n': n, 'dim': args.dim}
+
+    base = memory()['rss_mb']
+    # download.init_db() without its probe embedding call
+    db = FAISS(embedding_function=embeddings, index=ann.new_index(args.dim), docstore=MmapDocstore(), index_to_docstore_id={})
+    docs = [Document(page_content=text, metadata={'repo_name': f'bench/repo-{i}'}) for i, text in enumerate(texts)]
+
+    def build():
+        for start in range(0, n, args.batch):
+            store.add_documents(db, docs[start:start + args.batch])
+    _, result['build_seconds'] = timeit(build)
+    lexical = store.lexical_index(db)
+    _, result['bm25_build_seconds'] = timeit(lexical._weights)
+    latencies = []
+    for text in query_texts:
+        _, seconds = timeit(lambda: lexical.score_batch([text]))
+        latencies.append(seconds)
+    result['bm25_query'] = percentiles(latencies)
+    _, result['bm25_batch_query_seconds'] = timeit(lambda: lexical.score_batch(query_texts))
+
+    # exact neighbours, the reference for every configuration's recall
+    flat = ann.build_index(vectors, 'flat')
+    _, truth = flat.search(query_vectors, args.k)
+    exact_hybrid = [[doc.metadata['repo_name'] for doc, _ in hits] for hits in hybrid_search(db, query_texts, k=args.k)]
+    del flat
+    view_ids = set(random.Random(n).sample(list(db.index_to_docstore_id.values()), max(int(n * args.view_fraction), args.k)))
+    view_queries = query_texts[:args.hybrid_queries]
+    exact_view = [[doc.metadata['repo_name'] for doc, _ in hits]
+                  for hits in hybrid_search(db, view_queries, k=args.k, allowed_ids=view_ids)]
+    result['view_docs'] = len(view_ids)
+
+    path = os.path.join(workdir, f'store-{n}')
+    _, result['save_seconds'] = timeit(lambda: store.save_store(db, path))
+    result['disk_mb'] = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2 ** 20
+    result['rss_after_build_mb'] = memory()['rss_mb'] - base
+
+    result['indexes'] = {}
+    for kind in args.kinds:
+        _, build_seconds = timeit(lambda: ann.rebuild_index(db, kind))
+        # IVF kinds fall back to flat on corpora too small to train them
+        stats = {'built': ann.index_kind(db.index), 'build_seconds': build_seconds,
+                 'index_mb': ann.estimated_bytes(db.index) / 2 ** 20}
+        knobs = [None]
+        if kind == 'hnsw':
+            knobs = args.ef_search
+        elif kind.startswith('ivf'):
+            knobs = args.nprobe
+        for knob in knobs:
+            kwargs = {}
+            if kind == 'hnsw':
+                kwargs['ef_search'] = knob
+            elif kind.startswith('ivf'):
+                kwargs['nprobe'] = knob
+            params = ann.search_parameters(db.index, nprobe=kwargs.get('nprobe'), ef_search=kwargs.get('ef_search'))
+            search_kwargs = {'params': params} if params is not None else {}
+            latencies, found = [], []
+            for vector in query_vectors:
+                (_, indices), seconds = timeit(lambda: db.index.search(vector[None], args.k, **search_kwargs))
+                latencies.append(seconds)
+                found.append(indices[0])
+            hybrid_latencies, hybrid_found = [], []
+            for text in query_texts[:args.hybrid_queries]:
+                hits, seconds = timeit(lambda: hybrid_search(db, text, k=args.k, **kwargs))
+                hybrid_latencies.append(seconds)
+                hybrid_found.append([doc.metadata['repo_name'] for doc, _ in hits])
+            name = kind if knob is None else f'{kind}/{"ef_search" if kind == "hnsw" else "nprobe"}={knob}'
+            stats[name] = {
+                'faiss_query': percentiles(latencies),
+                'recall@k': recall(found, truth, args.k),
+                'hybrid_query': percentiles(hybrid_latencies),
+                'hybrid_recall@k': recall(hybrid_found, exact_hybrid, args.k),
+            }
+        latencies, found = [], []
+        for text in view_queries:
+            hits, seconds = timeit(lambda: hybrid_search(db, text, k=args.k, allowed_ids=view_ids))
+            latencies.append(seconds)
+            found.append([doc.metadata['repo_name'] for doc, _ in hits])
+        stats['view'] = {'hybrid_query': percentiles(latencies), 'recall@k': recall(found, exact_view, args.k)}
+        result['indexes'][kind] = stats
+        print(f'n={n} {kind}: ' + ', '.join(
+            f"{name} recall {value['recall@k']:.3f} p50 {value['faiss_query']['p50'] * 1e3:.2f}ms"
+            for name, value in stats.items() if isinstance(value, dict) and name != 'view'
+        ) + f", view of {len(view_ids)} recall {stats['view']['recall@k']:.3f} p50 {stats['view']['hybrid_query']['p50'] * 1e3:.2f}ms")
+
+    # reopen read-only and memory-mapped, the way search_db sees a saved store
+    store.save_store(db, path)
+    del db
+    loaded, result['load_seconds'] = timeit(lambda: store.load_store(path, embeddings))
+    latencies = []
+    for text in query_texts[:args.hybrid_queries]:
+        _, seconds = timeit(lambda: hybrid_search(loaded, text, k=args.k))
+        latencies.append(seconds)
+    result['loaded_hybrid_query'] = percentiles(latencies)
+    result['memory'] = memory()
+    shutil.rmtree(path, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--kinds', nargs='+', default=['flat', 'hnsw', 'ivf_flat', 'ivf_sq8', 'ivf_pq'])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--hybrid-queries', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--nprobe', nargs='+', type=int, default=[4, 16, 64])
+    parser.add_argument('--ef-search', nargs='+', type=int, default=[16, 64, 256])
+    parser.add_argument('--view-fraction', type=float, default=0.02)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+    root = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='ragc-retrieval-')
+    os.chdir(workdir)
+    try:
+        results = {'args': vars(args), 'started': time.time(), 'sizes': [bench_size(n, args, workdir) for n in args.sizes]}
+    finally:
+        os.chdir(root)
+        shutil.rmtree(workdir, ignore_errors=True)
+    for size in results['sizes']:
+        print(json.dumps({key: value for key, value in size.items() if key != 'indexes'}, default=float))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, default=float)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import re
+
+from langchain_core.documents import Document
+
+from ingest import count_tokens
+from lexical import tokenize
+
+# language -> pattern that shows a README (or a requirement) is about it
+languages = {
+    'c++': re.compile(r'c\+\+|\bcpp\b', re.IGNORECASE),
+    'c': re.compile(r'\b(written|implemented) in c\b|\bansi c\b|\bc(89|99|11|17)\b', re.IGNORECASE),
+    'cuda': re.compile(r'\bcuda\b', re.IGNORECASE),
+    'python': re.compile(r'\bpython\b|\bpip install\b|\bpytorch\b', re.IGNORECASE),
+    'rust': re.compile(r'\brust\b|\bcargo (build|install|run)\b', re.IGNORECASE),
+    'go': re.compile(r'\bgolang\b|\bgo (get|install|build|module)\b', re.IGNORECASE),
+    'java': re.compile(r'\bjava\b(?!script)', re.IGNORECASE),
+    'javascript': re.compile(r'\bjavascript\b|\bnode\.?js\b|\bnpm (install|run)\b', re.IGNORECASE),
+    'typescript': re.compile(r'\btypescript\b', re.IGNORECASE),
+    'julia': re.compile(r'\bjulia\b', re.IGNORECASE),
+    'matlab': re.compile(r'\bmatlab\b', re.IGNORECASE),
+}
+# languages that are usually one part of a stack, mentioning them never rules a repo out
+companion_languages = {'c', 'cuda'}
+file_format = re.compile(r'(?<![\w.])\.([a-z][a-z0-9]{1,5})\b', re.IGNORECASE)
+
+
+def requirements(description):
+    """Languages and file extensions explicitly asked for in `description`."""
+    return {
+        'languages': {name for name, pattern in languages.items() if pattern.search(description)},
+        'formats': {ext.lower() for ext in file_format.findall(description)},
+    }
+
+
+def excerpt(description, text, max_tokens=600):
+    """Paragraphs of `text` that share the most terms with `description`, in their original order, up to `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    terms = set(tokenize(description))
+    paragraphs = [p for p in re.split(r'\n\s*\n', text) if p.strip()]
+    scored = sorted(
+        range(len(paragraphs)),
+        key=lambda i: (len(terms & set(tokenize(paragraphs[i]))), -i),
+        reverse=True,
+    )
+    keep, budget = [], max_tokens
+    for i in scored:
+        tokens = count_tokens(paragraphs[i])
+        if tokens > budget:
+            continue
+        keep.append(i)
+        budget -= tokens
+    if not keep:
+        # one huge paragraph: fall back to its head
+        return text[:max_tokens * 4]
+    return '\n\n'.join(paragraphs[i] for i in sorted(keep))
+
+
+class ReviewCascade:
+    """Cheap filters run on retrieval hits before any of them reaches the LLM reviewer.
+
+    A hit is skipped when its fused score is below `min_score`, below
+    `min_ratio` of the leader's score, or when its README names other
+    languages but none of the ones the description asks for. With
+    `require_formats` a README must also mention one of the requested file
+    formats. At most `max_reviews` hits pass, each cut to an excerpt of
+    `excerpt_tokens`.
+
+    `min_score` and `min_ratio` only mean something for similarity-like
+    scores (`fusion='weighted'`). RRF scores are rank reciprocals: a hit
+    found by one retriever scores about half of one found by both, however
+    relevant it is, so both are off by default.
+    """
+
+    def __init__(self, min_score=None, min_ratio=None, max_reviews=None, check_languages=True, require_formats=False,
+                 excerpt_tokens=600):
+        self.min_score = min_score
+        self.min_ratio = min_ratio
+        self.max_reviews = max_reviews
+        self.check_languages = check_languages
+        self.require_formats = require_formats
+        self.excerpt_tokens = excerpt_tokens
+
+    def _reject(self, wanted, doc, score, leader):
+        if self.min_score is not None and score < self.min_score:
+            return f'score {score:.4g} below {self.min_score}'
+        if self.min_ratio and leader > 0 and score < self.min_ratio * leader:
+            return f'score {score:.4g} below {self.min_ratio} of leader {leader:.4g}'
+        text = doc.page_content
+        if self.check_languages and wanted['languages']:
+            mentioned = {name for name, pattern in languages.items() if pattern.search(text)}
+            if mentioned - companion_languages and not mentioned & wanted['languages']:
+                return f"README is about {', '.join(sorted(mentioned))}, not {', '.join(sorted(wanted['languages']))}"
+        if self.require_formats and wanted['formats']:
+            lowered = text.lower()
+            if not any('.' + ext in lowered for ext in wanted['formats']):
+                return f"no mention of {', '.join(sorted(wanted['formats']))}"
+        return None
+
+    def apply(self, description, hits):
+        """Split (Document, score) `hits` into Documents worth an LLM review and skipped {repo_name, reason} records."""
+        wanted = requirements(description)
+        leader = max((score for _, score in hits), default=0.0)
+        passed, skipped = [], []
+        for doc, score in hits:
+            reason = self._reject(wanted, doc, score, leader)
+            if reason is None and self.max_reviews is not None and len(passed) >= self.max_reviews:
+                reason = f'beyond the first {self.max_reviews} candidates'
+            if reason is not None:
+                skipped.append({'repo_name': doc.metadata.get('repo_name'), 'score': score, 'reason': reason})
+                continue
+            text = excerpt(description, doc.page_content, self.excerpt_tokens) if self.excerpt_tokens else doc.page_content
+            passed.append(Document(page_content=text, metadata=doc.metadata))
+        return passed, skipped
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+
+db_root = './db'
+catalog_path = './db/catalog.json'
+
+
+def normalize(keywords):
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    return frozenset(' '.join(keyword.lower().split()) for keyword in keywords if keyword.strip())
+
+
+class Catalog:
+    """Index of the keyword-set stores under ./db.
+
+    Maps each normalized keyword set to its store path, repo count and
+    creation time, plus keyword -> sets containing it, so lookups never list
+    the directory or parse store names (which broke on hyphenated keywords).
+    """
+
+    def __init__(self, path=catalog_path, root=db_root):
+        self.path = path
+        self.root = root
+        self.entries = {}
+        self.by_keyword = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f):
+                    self._add(entry)
+        elif os.path.isdir(root):
+            self._import_legacy()
+
+    def _add(self, entry):
+        key = normalize(entry['keywords'])
+        self.entries[key] = entry
+        for keyword in key:
+            self.by_keyword.setdefault(keyword, set()).add(key)
+
+    def _import_legacy(self):
+        # stores written before the catalog existed are named '-'.join(keywords)
+        for item in os.listdir(self.root):
+            store_path = os.path.join(self.root, item)
+            if item.startswith('_') or not os.path.isdir(store_path):
+                continue
+            self._add({
+                'keywords': item.split('-'),
+                'path': store_path,
+                'repos': None,
+                'created': os.path.getmtime(store_path),
+            })
+        if self.entries:
+            self.save()
+
+    def lookup(self, keywords):
+        """Find stores that cover `keywords`.
+
+        Returns ('exact', [entry]) for the same keyword set, ('superset',
+        [entry]) for the smallest store whose keywords include all of them,
+        ('union', entries) when every keyword is covered by some store, or
+        (None, []).
+        """
+        key = normalize(keywords)
+        with self._lock:
+            if key in self.entries:
+                return 'exact', [self.entries[key]]
+            if not key or any(keyword not in self.by_keyword for keyword in key):
+                return None, []
+            supersets = set.intersection(*(self.by_keyword[keyword] for keyword in key))
+            if supersets:
+                best = min(supersets, key=lambda k: (len(k), self.entries[k]['repos'] or 0))
+                return 'superset', [self.entries[best]]
+            entries = []
+            uncovered = set(key)
+            # greedily pick the store covering most of the remaining keywords
+            while uncovered:
+                candidates = set().union(*(self.by_keyword[keyword] for keyword in uncovered))
+                best = max(candidates, key=lambda k: (len(k & uncovered), -len(k)))
+                entries.append(self.entries[best])
+                uncovered -= best
+            return 'union', entries
+
+    def register(self, keywords, path, repos=None):
+        with self._lock:
+            self._add({
+                'keywords': sorted(normalize(keywords)),
+                'path': path,
+                'repos': repos,
+                'created': time.time(),
+            })
+        self.save()
+
+    def save(self):
+        with self._lock:
+            data = list(self.entries.values())
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
@@ -1,84 +1,134 @@
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from llm_cache import CachedLLM
 from tenacity import (
     retry,
     retry_if_exception_type,
     wait_random_exponential,
 )  # for exponential backoff
 import openai
-from search import search_github, search_db
-from download import load_vector_db
+from corpus import get_corpus
+from cascade import ReviewCascade
 from dotenv import load_dotenv
 
+from concurrent.futures import ThreadPoolExecutor, wait
+from dag import run_dag
+import asyncio
+import contextvars
 import json
 import os
+import time
 load_dotenv()
 
 openai_key = os.getenv('OPENAI_API_KEY')
 
-embeddings = OpenAIEmbeddings()
-llm = ChatOpenAI(
+llm = CachedLLM(ChatOpenAI(
         api_key=openai_key,
         model='gpt-3.5-turbo-0125',
         max_tokens='512'
-    )
+    ))
+
+# cheap filters in front of the LLM review, None sends every hit in full
+default_cascade = ReviewCascade()
+
+class Cancelled(Exception):
+    """The run's `cancel` event was set, e.g. by an evaluation timeout."""
+
+def run(code_description, max_in_flight=4, stop_after=None, cascade=default_cascade, cancel=None):
+    """Blocking `run_async`; async callers should `await run_async(...)` instead.
+
+    Called while an event loop is running in this thread (a notebook, an
+    async server), the run gets its own loop on a helper thread, since
+    `asyncio.run` cannot nest.
+    """
+    coro = run_async(code_description, max_in_flight=max_in_flight, stop_after=stop_after, cascade=cascade,
+                     cancel=cancel)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+async def run_async(code_description, max_in_flight=4, stop_after=None, cascade=default_cascade, cancel=None):
+    """`run` as a stage graph: the query README is written while GitHub is searched and READMEs are ingested.
+
+    Setting the `cancel` event (a `threading.Event`) stops the run at the
+    next stage boundary, between README downloads and between reviews, and
+    raises `Cancelled`.
+    """
+    def check():
+        if cancel is not None and cancel.is_set():
+            raise Cancelled('run cancelled')
+
+    # usage of the keyword and query-text prompts, reviews carry their own
+    calls = []
 
-def run(code_description):
-    print("Generating query keywords...")
     # 1. LLM 生成关键词
-    keywords = get_query_keywords(code_description).split(',')
-    keywords = [keyword.lower().strip() for keyword in keywords]
-    print(keywords)
-
-    # 2. 判断有无缓存
-    db_path = check_local(keywords)
-    if db_path:
-        vector_store = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
-    else:
-    # 3. 返回仓库列表
-        repos = search_github(keywords, 1)
-        if len(repos) == 0:
-            return None
-    # 4. 下载所有仓库readme到数据库
-        vector_store = load_vector_db(repos)
-        db_file_name = '-'.join(keywords).lower()
-        vector_store.save_local(f'./db/{db_file_name}')
-    # 5. 检索最相似的仓库
-    query_readme = get_query_text(code_description)
-    similar_repo = search_db(vector_store, query_readme)
-    # print(similar_repo)
+    def keywords():
+        check()
+        print("Generating query keywords...")
+        keywords = get_query_keywords(code_description, usage=calls).split(',')
+        keywords = [keyword.lower().strip() for keyword in keywords]
+        print(keywords)
+        return keywords
+
+    # 2-4. 共享语料库: 只搜索没见过的关键词, 只下载语料库里没有的仓库
+    def corpus(keywords):
+        check()
+        return bool(get_corpus().ensure(keywords, cancel=cancel))
+
+    # 5. 检索最相似的仓库 (查询文本只依赖需求描述, 与 2-4 并行生成)
+    def text():
+        check()
+        return get_query_text(code_description, usage=calls)
+
+    def retrieve(keywords, corpus, text):
+        check()
+        if not corpus:
+            return []
+        return get_corpus().search(text, keywords, with_scores=True)
 
     # 6. 组合起来
-    # prompt = '\n\n'.join([f'repo_name_{i}: {repo.metadata["repo_name"]}, repo_readme{i}: {repo.page_content}' for i, repo in enumerate(similar_repo)])
-    # print(f"Best matching repository: {similar_repo}")
-    # result = similar_repo[0].metadata["repo_name"]
-    try: 
-        result = review_query_text(code_description, similar_repo)
-    except:
-        pass
+    def review(retrieve):
+        check()
+        candidates, skipped = cascade.apply(code_description, retrieve) if cascade else ([repo for repo, _ in retrieve], [])
+        reviews = []
+        try:
+            reviews = list(iter_reviews(code_description, candidates, max_in_flight=max_in_flight, stop_after=stop_after,
+                                        cancel=cancel))
+        except Exception as e:
+            print(f"Review failed: {e}")
+        check()
+        return reviews, skipped
+
+    results, trace = await run_dag({
+        'keywords': (keywords, []),
+        'text': (text, []),
+        'corpus': (corpus, ['keywords']),
+        'retrieve': (retrieve, ['keywords', 'corpus', 'text']),
+        'review': (review, ['retrieve']),
+    })
+    print(f"Stages {' -> '.join(trace['critical_path'])} took {trace['total_seconds']:.1f}s")
+    if not results['corpus']:
+        return None
+    reviews, skipped = results['review']
     return {
-        'result': result,
-        'top5': [repo.metadata["repo_name"] for repo in similar_repo],
-        'keywords': keywords,
-        'text': query_readme
+        'result': [review['repo_name'] for review in reviews if review['verdict']],
+        'top5': [repo.metadata["repo_name"] for repo, _ in results['retrieve']],
+        'keywords': results['keywords'],
+        'text': results['text'],
+        'calls': calls,
+        'reviews': reviews,
+        'skipped': skipped,
+        'trace': trace,
     }
     # 6. 下载到本地
     # repo_name = similar_repo.metadata['repo_name']
     # clone_github_repo(repo_name)
 
-def check_local(keywords):
-    folder_path = './db'
-    keywords = set(keywords)
-    for item in os.listdir(folder_path):
-        store_keywords = set(item.split('-'))
-        if store_keywords == keywords:
-            return os.path.join(folder_path, item)
-    return None
-
 @retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
-def get_query_keywords(function_description):
+def get_query_keywords(function_description, usage=None):
     prompt_template = PromptTemplate(
         input_variables=["function_description"],
         template="""
@@ -98,10 +148,10 @@ def get_query_keywords(function_description):
         """
     )
     prompt = prompt_template.format(function_description=function_description)
-    return llm.invoke(prompt).content
+    return _invoke(prompt, usage).content
 
 @retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
-def get_query_text(function_description):
+def get_query_text(function_description, usage=None):
     prompt_template = PromptTemplate(
         input_variables=["function_description"],
         template="""
@@ -117,12 +167,25 @@ def get_query_text(function_description):
         """
     )
     prompt = prompt_template.format(function_description=function_description)
-    return llm.invoke(prompt).content
+    return _invoke(prompt, usage).content
 
-@retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
-def review_query_text(function_description, similar_repos):
-    prompt_template = PromptTemplate(
-        input_variables=["function_description"],
+def call_usage(message):
+    """Token usage of one LLM answer; `cached` ones cost nothing this run."""
+    usage = getattr(message, 'usage_metadata', None) or {}
+    return {
+        'input_tokens': usage.get('input_tokens', 0),
+        'output_tokens': usage.get('output_tokens', 0),
+        'cached': bool(message.response_metadata.get('cached')),
+    }
+
+def _invoke(prompt, usage=None):
+    message = llm.invoke(prompt)
+    if usage is not None:
+        usage.append(call_usage(message))
+    return message
+
+review_template = PromptTemplate(
+        input_variables=["function_description", "repo_readme"],
         template="""
         You are an AI assistant, analyze the README of a repo with user's requirments and determine if the repository satisfies all of the user's requirments.
 
@@ -135,32 +198,71 @@ def review_query_text(function_description, similar_repos):
         Please analyze first, and then ouput `True` if the repo satisfies all the requirments, otherwise output `False`.
         """
     )
-    results = []
-    for i, repo in enumerate(similar_repos):
-        repo_readme = repo.page_content
-        prompt = prompt_template.format(function_description=function_description, repo_readme=repo_readme)
-        result = llm.invoke(prompt).content
-        # with open('review.txt', 'a') as f:
-        #     f.write(result + '\n')
-        if 'true' in result.lower():
-            results.append(repo.metadata['repo_name'])
-    return results
-    
-
-def eval_papers_with_code():
-    with open('./papers_cleaned.json', 'r') as f:
-        inputs = json.load(f)
-    with open('./papers_cleaned_results.json', 'a') as f: 
-        for input in inputs[16:]:
-            code_description = f"""
-            Provide the most relevant GitHub repository about the following title and abstract: {input['abstract']}
-            """
-            result = run(code_description)
-            f.write(json.dumps({
-                'title': input['title'],
-                'result': result
-            }) + '\n')
-            f.flush()
+
+@retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
+def review_repo(function_description, repo):
+    """Ask the LLM whether `repo` satisfies the requirement; returns the verdict with its latency and token usage."""
+    prompt = review_template.format(function_description=function_description, repo_readme=repo.page_content)
+    start = time.time()
+    message = llm.invoke(prompt)
+    return {
+        'repo_name': repo.metadata['repo_name'],
+        'verdict': 'true' in message.content.lower(),
+        'seconds': time.time() - start,
+        **call_usage(message),
+    }
+
+def iter_reviews(function_description, similar_repos, max_in_flight=4, stop_after=None, cancel=None):
+    """Review `similar_repos` concurrently and yield the reviews in rank order.
+
+    At most `max_in_flight` reviews run at once. With `stop_after`, reviews
+    stop (and queued ones are cancelled) once that many repos, counted in
+    rank order, got a `True` verdict; likewise once the `cancel` event is set
+    or the consumer stops iterating. Stopping never waits for the reviews
+    already in flight: their threads finish in the background and their
+    results are dropped.
+    """
+    similar_repos = list(similar_repos)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    try:
+        # submit a window ahead of the consumer so cancelled reviews are never sent
+        futures = []
+        def submit_next():
+            if len(futures) < len(similar_repos):
+                # in a copy of the caller's context, so the review's llm spans join the run's trace
+                futures.append(executor.submit(contextvars.copy_context().run, review_repo, function_description,
+                                               similar_repos[len(futures)]))
+        for _ in range(max_in_flight):
+            submit_next()
+        accepted = 0
+        for i in range(len(similar_repos)):
+            # poll so a cancel set while a review is in flight is noticed without waiting for it
+            while not wait([futures[i]], timeout=0.5).done:
+                if cancel is not None and cancel.is_set():
+                    return
+            try:
+                review = futures[i].result()
+            except Exception as e:
+                print(f"Review of {similar_repos[i].metadata['repo_name']} failed: {e}")
+                review = {'repo_name': similar_repos[i].metadata['repo_name'], 'verdict': False, 'error': str(e)}
+            yield review
+            accepted += review['verdict']
+            if (stop_after is not None and accepted >= stop_after) or (cancel is not None and cancel.is_set()):
+                return
+            submit_next()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def review_query_text(function_description, similar_repos, max_in_flight=4, stop_after=None):
+    """Names of the repos (in rank order) whose README satisfies the requirement."""
+    reviews = iter_reviews(function_description, similar_repos, max_in_flight=max_in_flight, stop_after=stop_after)
+    return [review['repo_name'] for review in reviews if review['verdict']]
+
+
+def eval_papers_with_code(workers=4, processes=1):
+    # resumable: papers with a line in papers_cleaned_results.json are skipped
+    from eval_runner import run_eval
+    return run_eval(workers=workers, processes=processes)
 
 if __name__ == '__main__':
     code_description = f"""
@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+
+from download import init_db, load_readme, embeddings
+from search import iter_github, search_db, max_pages
+from store import load_store, save_store, store_cache
+
+corpus_path = './db/_corpus'
+manifest_file = 'manifest.json'
+
+
+class Corpus:
+    """One deduplicated README index shared by every keyword set.
+
+    Each repo is fetched and embedded once, however many searches return it.
+    The manifest records which keywords returned which repos, so the store for
+    a keyword set is just a filter (`view`) over the shared index.
+    """
+
+    def __init__(self, path=corpus_path):
+        self.path = path
+        self.lock = threading.RLock()
+        # repo_name -> {'keywords': [...], 'ids': [docstore ids]}; ids is empty for repos without a README
+        self.repos = {}
+        # keyword -> repo names in search rank order
+        self.keywords = {}
+        # keywords some of whose repos failed to download or index; searched again by the next ensure
+        self.incomplete = set()
+        # keyword / repo_name -> event set when the ensure call searching / fetching it is done
+        self._searching = {}
+        self._fetching = {}
+        manifest = os.path.join(path, manifest_file)
+        if os.path.exists(manifest):
+            # opened writable (index in RAM) because ensure() adds to it
+            self.db = load_store(path, embeddings, writable=True)
+            store_cache.put(path, self.db)
+            with open(manifest) as f:
+                data = json.load(f)
+            self.repos = data['repos']
+            self.keywords = data['keywords']
+            self.incomplete = set(data.get('incomplete', []))
+        else:
+            self.db = init_db()
+
+    def ensure(self, keywords, pages=max_pages, cancel=None):
+        """Search the keywords not seen before and ingest the repos not yet in the corpus; return the view.
+
+        The GitHub search, README downloads and embedding run without the
+        lock; it is only taken to add each batch to the index and to record
+        and save the results, so `search` and other queries keep running on
+        the committed state. A keyword or repo another call is already
+        ingesting is waited for instead of fetched twice. Once the `cancel`
+        event is set no more repos are fed to ingestion; keywords whose
+        search did not finish are searched again next time. Repos whose
+        README fetch or indexing failed are not recorded, and their keywords
+        are searched again next time so those repos are retried; a repo
+        without a README is recorded with no ids. If the search or ingestion
+        fails midway, the docs already indexed are still recorded under their
+        repos (and saved) before the error propagates.
+        """
+        done = threading.Event()
+        with self.lock:
+            missing = [keyword for keyword in dict.fromkeys(keywords)
+                       if (keyword not in self.keywords or keyword in self.incomplete) and keyword not in self._searching]
+            others = {self._searching[keyword] for keyword in keywords if keyword in self._searching}
+            for keyword in missing:
+                self._searching[keyword] = done
+        try:
+            if missing:
+                others |= self._ingest(missing, pages, cancel, done)
+        finally:
+            with self.lock:
+                for keyword in missing:
+                    del self._searching[keyword]
+                for repo_name in [name for name, event in self._fetching.items() if event is done]:
+                    del self._fetching[repo_name]
+            done.set()
+        for event in others:
+            # another call is ingesting some of these keywords or repos, its docs belong in this view too
+            while not event.wait(0.5):
+                if cancel is not None and cancel.is_set():
+                    break
+        return self.view(keywords)
+
+    def _ingest(self, missing, pages, cancel, done):
+        # returns the events of the other ensure calls that were already fetching some of the repos found
+        by_keyword = {}
+        found, new_repos = [], []
+        others = set()
+        # repo_name -> docstore ids, filled as batches are added to the index
+        indexed = {}
+
+        def unseen():
+            # streamed, so READMEs are fetched while later result pages are still searched
+            for repo in iter_github(missing, pages, by_keyword=by_keyword):
+                if cancel is not None and cancel.is_set():
+                    print("Corpus update cancelled")
+                    return
+                found.append(repo.full_name)
+                with self.lock:
+                    if repo.full_name in self.repos:
+                        continue
+                    claimed = self._fetching.get(repo.full_name)
+                    if claimed is not None:
+                        others.add(claimed)
+                        continue
+                    self._fetching[repo.full_name] = done
+                new_repos.append(repo.full_name)
+                yield repo
+
+        def record(docs, ids):
+            for doc, doc_id in zip(docs, ids):
+                indexed.setdefault(doc.metadata['repo_name'], []).append(doc_id)
+
+        try:
+            stats = load_readme(unseen(), self.db, lock=self.lock, on_batch=record)
+        except BaseException:
+            with self.lock:
+                # batches added before the failure are in the index: map them to their
+                # repos so they are not orphaned; repos without docs are fetched again next time
+                self._record(indexed)
+                self.save()
+            raise
+        print(f"{len(new_repos)} of {len(found)} repos are new to the corpus")
+        # repos whose fetch or indexing failed stay unrecorded, so the next ensure fetches them again
+        failed = set(stats['failed_repos'])
+        with self.lock:
+            for repo_name in new_repos:
+                if repo_name not in failed:
+                    self.repos.setdefault(repo_name, {'keywords': [], 'ids': []})
+            self._record(indexed, skip=failed)
+            for keyword, repo_names in by_keyword.items():
+                self.keywords[keyword] = repo_names
+                if failed.intersection(repo_names):
+                    self.incomplete.add(keyword)
+                else:
+                    self.incomplete.discard(keyword)
+                for repo_name in repo_names:
+                    entry = self.repos.get(repo_name)
+                    if entry is not None and keyword not in entry['keywords']:
+                        entry['keywords'].append(keyword)
+            self.save()
+        return others
+
+    def _record(self, indexed, skip=()):
+        # docs of `skip` (partly indexed, fetched again next time) stay out of every view
+        for repo_name, ids in indexed.items():
+            if repo_name not in skip:
+                self.repos.setdefault(repo_name, {'keywords': [], 'ids': []})['ids'].extend(ids)
+
+    def view(self, keywords):
+        """Docstore ids of every repo returned by any of `keywords`."""
+        with self.lock:
+            ids = set()
+            for keyword in keywords:
+                for repo_name in self.keywords.get(keyword, []):
+                    ids.update(self.repos.get(repo_name, {}).get('ids', []))
+            return ids
+
+    def search(self, query, keywords, **kwargs):
+        # the lock is only ever held for index changes and saves, never for network I/O
+        with self.lock:
+            return search_db(self.db, query, allowed_ids=self.view(keywords), **kwargs)
+
+    def save(self):
+        with self.lock:
+            save_store(self.db, self.path)
+            tmp_path = os.path.join(self.path, manifest_file + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'repos': self.repos, 'keywords': self.keywords, 'incomplete': sorted(self.incomplete)}, f)
+            os.replace(tmp_path, os.path.join(self.path, manifest_file))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'repos': len(self.repos),
+                'docs': self.db.index.ntotal,
+                'keywords': len(self.keywords),
+            }
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus():
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = Corpus()
+        return _corpus
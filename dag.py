@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import telemetry
+
+
+def check_dag(stages):
+    """Raise ValueError if a stage depends on an unknown stage or the dependencies form a cycle."""
+    for name, (_, deps) in stages.items():
+        unknown = [dep for dep in deps if dep not in stages]
+        if unknown:
+            raise ValueError(f"stage {name!r} depends on unknown stages {unknown}")
+    # Kahn's algorithm: whatever is never freed of its dependencies sits on a cycle
+    waiting = {name: set(deps) for name, (_, deps) in stages.items()}
+    ready = [name for name, deps in waiting.items() if not deps]
+    while ready:
+        done = ready.pop()
+        del waiting[done]
+        for name, deps in waiting.items():
+            if done in deps:
+                deps.discard(done)
+                if not deps:
+                    ready.append(name)
+    if waiting:
+        raise ValueError(f"stages {sorted(waiting)} form a dependency cycle")
+
+
+async def run_dag(stages):
+    """Run `stages` ({name: (fn, [dependency names])}) as soon as their dependencies finish.
+
+    `fn` is called with one keyword argument per dependency, holding that
+    stage's result; plain functions run in a worker thread so blocking LLM
+    and GitHub calls overlap. Returns ({name: result}, trace) where the trace
+    has each stage's start/end/seconds (relative to the start of the run),
+    the total wall time and the critical path: the chain of stages,
+    following the dependency that finished last, that ended the run. The
+    graph is checked with `check_dag` before any stage starts.
+    """
+    check_dag(stages)
+    start = time.perf_counter()
+    tasks = {}
+    timings = {}
+
+    async def run_stage(name, fn, deps):
+        inputs = {dep: await tasks[dep] for dep in deps}
+        stage_start = time.perf_counter()
+        with telemetry.span(f'stage.{name}'):
+            if asyncio.iscoroutinefunction(fn):
+                result = await fn(**inputs)
+            else:
+                result = await asyncio.to_thread(fn, **inputs)
+        stage_end = time.perf_counter()
+        timings[name] = {
+            'start': stage_start - start,
+            'end': stage_end - start,
+            'seconds': stage_end - stage_start,
+        }
+        return result
+
+    for name, (fn, deps) in stages.items():
+        tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    path = []
+    name = max(timings, key=lambda n: timings[n]['end'], default=None)
+    while name is not None:
+        path.append(name)
+        deps = stages[name][1]
+        name = max(deps, key=lambda n: timings[n]['end']) if deps else None
+    trace = {
+        'stages': timings,
+        'total_seconds': time.perf_counter() - start,
+        'critical_path': path[::-1],
+    }
+    return {name: task.result() for name, task in tasks.items()}, trace
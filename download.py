@@ -1,100 +1,161 @@
 import os
+import asyncio
 import subprocess
+import contextlib
+import contextvars
 import openai
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
-from search import search_github
+from search import iter_github
 from langchain_community.vectorstores import FAISS
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from search import make_request
-from github import Github
+from embedding_cache import default_embeddings
+from ingest import BatchIndexer, ReadmeChunker
+from mmap_store import MmapDocstore
+from store import save_store
+import ann
+from gh_async import AsyncGithub, api_url
+from http_cache import pushed_at
+from readme_store import default_store
+import telemetry
 import time
-import json
 from tenacity import (
     retry,
     retry_if_exception_type,
     wait_random_exponential,
 )  # for exponential backoff
 
-gh_token = os.getenv('GH_TOKEN')
-g = Github(gh_token)
-
-lock = threading.Lock()
 load_dotenv()
 
-headers = {
-            'Authorization': f'token {gh_token}',
-            'Accept': 'application/vnd.github.v3+json',
-            'User-Agent': 'Mozilla/5.0'
-        }
-embeddings = OpenAIEmbeddings()
+embeddings = default_embeddings()
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=150,
-    chunk_overlap=30,
-    length_function=len,
-    is_separator_regex=False,
-)
+def fetch_readme(repo):
+    """Raw README text of `repo`, or None if it has none.
 
-@retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
-def download_process(repo, db: FAISS):
-    rate_limit = g.get_rate_limit().core
-    if rate_limit.remaining == 0:
-        wait_time = rate_limit.reset.timestamp() - time.time()
-        print(f"Rate limit exceeded, sleeping for {wait_time} seconds")
-        time.sleep(wait_time+1)
-    try:
-        readme_content = repo.get_readme().decoded_content.decode("utf-8")
-    except Exception as e:
-        print(f"Error fetching README: {e}")
-    if readme_content:
-        docu = Document(
-            page_content=readme_content,
-            metadata={
-                'repo_name' : repo.full_name,
-                'repo_desc' : repo.description,
-                'star': repo.stargazers_count,
-            }
-        )
-        json_docu = {
-            'repo_name':repo.full_name,
-            'repo_desc':repo.description,
-            'star':repo.stargazers_count,
-            "page_content":readme_content
+    Fetched through `make_request`, so an unchanged README costs a 304 (or no
+    request at all when the repo has not been pushed since) instead of a
+    full download.
+    """
+    response = make_request(f'{api_url}/repos/{repo.full_name}/readme', accept='application/vnd.github.raw',
+                            pushed_at=pushed_at(repo))
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content.decode('utf-8')
+
+def download_process(repo, indexer: BatchIndexer):
+    """Fetch and queue the README of `repo`: 'ok', 'missing' (the repo has none) or 'failed'."""
+    with telemetry.span('github.readme', repo=repo.full_name) as span:
+        try:
+            readme_content = fetch_readme(repo)
+            span.set(bytes=len(readme_content or ''))
+        except Exception as e:
+            print(f"Error fetching README: {e}")
+            span.set(error=repr(e))
+            return 'failed'
+    if not readme_content:
+        return 'missing'
+    save_readme(repo, readme_content, indexer)
+    return 'ok'
+
+def save_readme(repo, readme_content, indexer: BatchIndexer):
+    docu = Document(
+        page_content=readme_content,
+        metadata={
+            'repo_name' : repo.full_name,
+            'repo_desc' : repo.description,
+            'star': repo.stargazers_count,
         }
-        # split_docu = text_splitter.split_documents([docu])
-        with lock:
-            with open("./readme.json", "a") as f:
-                json.dump(json_docu,f)
-                f.write('\n')
-                f.close()
-            db.add_documents([docu])
+    )
+    default_store().put(repo.full_name, readme_content, repo.description, repo.stargazers_count, pushed_at(repo))
+    indexer.put(docu)
+
+async def download_readmes_async(repos, indexer: BatchIndexer, concurrency=50):
+    """Fetch raw READMEs for all `repos` over one pooled aiohttp session; returns {repo_name: outcome} as `download_process`."""
+    async with AsyncGithub(concurrency=concurrency) as client:
+        async def fetch(repo):
+            try:
+                readme_content = await client.get_readme(repo.full_name, pushed_at=pushed_at(repo))
+            except Exception as e:
+                print(f"{repo.full_name} download error: {e}")
+                return repo.full_name, 'failed'
+            if not readme_content:
+                return repo.full_name, 'missing'
+            try:
+                # put() blocks when the indexer queue is full, keep that off the event loop
+                await asyncio.to_thread(save_readme, repo, readme_content, indexer)
+            except Exception as e:
+                print(f"{repo.full_name} save error: {e}")
+                return repo.full_name, 'failed'
+            return repo.full_name, 'ok'
+        if hasattr(repos, '__aiter__'):
+            # a streaming search (search.iter_github_async): start each fetch as its repo arrives
+            tasks = [asyncio.create_task(fetch(repo)) async for repo in repos]
+            return dict(await asyncio.gather(*tasks))
+        return dict(await asyncio.gather(*[fetch(repo) for repo in repos]))
 
 @retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
 def init_db():
     vector_store = FAISS(
         embedding_function=embeddings,
-        index=faiss.IndexFlatL2(len(embeddings.embed_query("hello world"))),
-        docstore=InMemoryDocstore(),
+        # starts flat: IVF needs training data, load_readme() switches type once the corpus is big enough
+        index=ann.new_index(len(embeddings.embed_query("hello world"))),
+        docstore=MmapDocstore(),
         index_to_docstore_id={},
     )
     return vector_store
 
-def load_readme(repos, db: FAISS):
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(download_process, repo, db): repo for repo in repos}
-        
-        for future in as_completed(futures):
-            repo = futures[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"{repo.full_name} download error: {e}")
+def load_readme(repos, db: FAISS, workers=5, batch_tokens=100000, queue_size=64, use_async=False,
+                chunk_tokens=None, max_tokens=2048, lock=None, on_batch=None):
+    """Fetch READMEs and index them in batches through one BatchIndexer.
+
+    With `use_async` the fetches go through `AsyncGithub` and `workers` is the
+    number of in-flight requests instead of the number of threads. Each README
+    is indexed whole by default; pass `chunk_tokens` (e.g. 256) to strip
+    boilerplate, cap it at `max_tokens` and index it as chunks of that many
+    tokens instead, which changes the store layout to several docs per repo.
+    `repos` may be a generator (`search.iter_github`) or, with `use_async`,
+    an async generator (`search.iter_github_async`), in which case fetching
+    starts with the first result page while later pages are still searched.
+    Returns the indexer's stats plus `missing_readmes`, the number of repos
+    GitHub confirmed have no README; `failed_repos` names every repo whose
+    fetch failed or whose documents were in a batch that failed to index
+    (`errors` counts those documents), which a caller should fetch again.
+    A shared `db` is only changed holding `lock`, and `on_batch(docs, ids)`
+    sees every batch as it is added (see `BatchIndexer`).
+    """
+    chunker = ReadmeChunker(chunk_tokens=chunk_tokens, max_tokens=max_tokens) if chunk_tokens else None
+    indexer = BatchIndexer(db, batch_tokens=batch_tokens, queue_size=queue_size, chunker=chunker, lock=lock,
+                           on_batch=on_batch)
+    start = time.time()
+    outcomes = {}
+    try:
+        if use_async:
+            outcomes = asyncio.run(download_readmes_async(repos, indexer, concurrency=workers))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # copy the caller's context per task so the README spans join the caller's trace
+                futures = {executor.submit(contextvars.copy_context().run, download_process, repo, indexer): repo
+                           for repo in repos}
+
+                for future in as_completed(futures):
+                    repo = futures[future]
+                    try:
+                        outcomes[repo.full_name] = future.result()
+                    except Exception as e:
+                        print(f"{repo.full_name} download error: {e}")
+                        outcomes[repo.full_name] = 'failed'
+    finally:
+        stats = indexer.close()
+        default_store().flush()
+    stats['missing_readmes'] = sum(outcome == 'missing' for outcome in outcomes.values())
+    stats['failed_repos'] = sorted(set(stats['failed_repos']) | {name for name, outcome in outcomes.items() if outcome == 'failed'})
+    with lock or contextlib.nullcontext():
+        ann.maybe_rebuild(db)
+    stats['seconds'] = time.time() - start
+    print(f"Ingested {stats['docs']} docs from {stats['repos']} READMEs in {stats['batches']} batches, {stats['seconds']:.1f}s total, {stats['index_seconds']:.1f}s embedding/indexing, {stats['tokens_per_repo']:.0f} embedded tokens/repo, {stats['errors']} docs failed to index, {len(stats['failed_repos'])} repos failed")
+    return stats
 
 def clone_github_repo(repo_name, destination=None):
     repo_url = f"https://github.com/{repo_name}.git"
@@ -130,27 +191,29 @@ def pack_repo(destination, repo_name):
     combined_code = read_and_combine_code(code_files)
     return combined_code
 
-def load_vector_db(repos):
+def load_vector_db(repos, workers=10, batch_tokens=100000, queue_size=64, use_async=False, chunk_tokens=None, max_tokens=2048):
     vector_store = init_db()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(download_process, repo, vector_store): repo for repo in repos}
-        
-        for future in as_completed(futures):
-            repo = futures[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"{repo.full_name} download error: {e}")
+    load_readme(repos, vector_store, workers=workers, batch_tokens=batch_tokens, queue_size=queue_size, use_async=use_async,
+                chunk_tokens=chunk_tokens, max_tokens=max_tokens)
+    return vector_store
+
+def rebuild_vector_db(repo_names=None, batch_tokens=100000, queue_size=64, chunk_tokens=None, max_tokens=2048):
+    """Build a store from the READMEs already in the README store (all, or those of `repo_names`), offline."""
+    vector_store = init_db()
+    chunker = ReadmeChunker(chunk_tokens=chunk_tokens, max_tokens=max_tokens) if chunk_tokens else None
+    indexer = BatchIndexer(vector_store, batch_tokens=batch_tokens, queue_size=queue_size, chunker=chunker)
+    try:
+        for docu in default_store().iter_documents(repo_names):
+            indexer.put(docu)
+    finally:
+        stats = indexer.close()
+    ann.maybe_rebuild(vector_store)
+    print(f"Rebuilt {stats['docs']} docs from {stats['repos']} stored READMEs, {stats['errors']} docs failed to index")
     return vector_store
 
 if __name__ == '__main__':
-    vector_store = FAISS(
-                    embedding_function=embeddings,
-                    index=faiss.IndexFlatL2(len(embeddings.embed_query("hello world"))),
-                    docstore=InMemoryDocstore(),
-                    index_to_docstore_id={},
-                )
-    repos = search_github('gaussian-splatting', 100)
+    vector_store = init_db()
+    repos = iter_github('gaussian-splatting', 10)
     load_readme(repos, vector_store)
-    vector_store.save_local("faiss_index")
+    save_store(vector_store, "faiss_index")
     print(vector_store.similarity_search("3D Gaussian Splatting with C kernel", k=1))
\ No newline at end of file
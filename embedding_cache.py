@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+import telemetry
+from sqlite_lru import LruTable, connect
+
+cache_path = './cache/embeddings.sqlite'
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed on-disk cache in front of an embedding model.
+
+    Vectors are keyed by (model, sha256(text)) and evicted least-recently-used
+    once more than `max_entries` are stored. The model key is taken from the
+    underlying model's name plus its `dimensions` when set (a shortened
+    text-embedding-3 vector is not interchangeable with the full one), unless
+    `model` is given. Safe to share between threads.
+    """
+
+    def __init__(self, underlying: Embeddings, path=cache_path, max_entries=500000, model=None):
+        self.underlying = underlying
+        if model is None:
+            model = getattr(underlying, 'model', None) or type(underlying).__name__
+            dimensions = getattr(underlying, 'dimensions', None)
+            if dimensions:
+                model = f'{model}:{dimensions}'
+        self.model = model
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = connect(
+            path,
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'model TEXT, hash TEXT, vector BLOB, last_used REAL, '
+            'PRIMARY KEY (model, hash))',
+            'CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)',
+        )
+        self._table = LruTable(self._conn, 'embeddings', ['model', 'hash'], max_entries)
+
+    def _lookup(self, hashes):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f'SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({",".join("?" * len(batch))})',
+                    [self.model, *batch],
+                ).fetchall()
+                for h, vector in rows:
+                    found[h] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                self._conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?',
+                    [(now, self.model, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            # another thread may have stored the same text meanwhile: the upsert only counts new keys
+            self._table.upsert(
+                ('model', 'hash', 'vector', 'last_used'),
+                [(self.model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts):
+        return self.embed_new(texts)[0]
+
+    def embed_new(self, texts):
+        """Vectors of `texts`, plus a flag per text telling whether it was sent to the model.
+
+        A text repeated in `texts` is embedded (and flagged) once, at its first occurrence.
+        """
+        with telemetry.span('embed.batch', model=self.model, texts=len(texts)) as span:
+            hashes = [content_hash(text) for text in texts]
+            found = self._lookup(list(set(hashes)))
+            missing = {}
+            new = []
+            for h, text in zip(hashes, texts):
+                new.append(h not in found and h not in missing)
+                if new[-1]:
+                    missing[h] = text
+            with self._lock:
+                self.hits += len(texts) - len(missing)
+                self.misses += len(missing)
+            span.set(hits=len(texts) - len(missing), misses=len(missing), chars=sum(len(text) for text in missing.values()))
+            telemetry.count('embed.misses', len(missing))
+            if missing:
+                vectors = self.underlying.embed_documents(list(missing.values()))
+                new_items = list(zip(missing.keys(), vectors))
+                self._store(new_items)
+                found.update(new_items)
+            return [found[h] for h in hashes], new
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'model': self.model,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self._table.size,
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_embeddings():
+    """The process-wide cached OpenAI embeddings every store is opened with."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CachedEmbeddings(OpenAIEmbeddings())
+        return _default
@@ -0,0 +1,190 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+
+inputs_path = './papers_cleaned.json'
+results_path = './papers_cleaned_results.json'
+
+prompt_template = """
+            Provide the most relevant GitHub repository about the following title and abstract: {abstract}
+            """
+
+
+def completed_titles(path):
+    """Titles that already have a result line in `path`, the checkpoint a run resumes from."""
+    titles = set()
+    if not os.path.exists(path):
+        return titles
+    with open(path) as f:
+        for line in f:
+            try:
+                titles.add(json.loads(line)['title'])
+            except (ValueError, KeyError):
+                # a line cut short by a crash, that paper runs again
+                continue
+    return titles
+
+
+def shard_of(title, shards):
+    return zlib.crc32(title.encode('utf-8')) % shards
+
+
+def _evaluate(paper, cancel=None):
+    # imported here so spawned shard processes open their own caches and corpus
+    from chain import run
+    start = time.time()
+    result = run(prompt_template.format(abstract=paper['abstract']), cancel=cancel)
+    return {'title': paper['title'], 'result': result, 'seconds': time.time() - start}
+
+
+def _use_shard_corpus(shard, shards):
+    """Point this process at its own corpus: shard processes must not write one store concurrently."""
+    import corpus
+    corpus._corpus = corpus.Corpus(path=f'{corpus.corpus_path}-shard{shard}-of-{shards}')
+
+
+def _work(papers, workers, timeout, events, shard=None):
+    """Evaluate `papers` on up to `workers` threads, reporting ('done' | 'failed', record) on `events`.
+
+    A paper still running after `timeout` seconds is reported as failed and
+    cancelled: its run stops at the next stage boundary (or between README
+    downloads and reviews), which releases the shared corpus for the other
+    papers; whatever it returns late is dropped. `shard` is (index, count)
+    in a shard process.
+    """
+    if shard is not None:
+        _use_shard_corpus(*shard)
+    pending = list(reversed(list(enumerate(papers))))
+    running = {}
+    finished = queue.Queue()
+
+    def evaluate(i, paper, cancel):
+        try:
+            finished.put(('done', i, _evaluate(paper, cancel)))
+        except Exception as e:
+            finished.put(('failed', i, {'title': paper['title'], 'error': repr(e)}))
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                i, paper = pending.pop()
+                cancel = threading.Event()
+                running[i] = (paper, time.time(), cancel)
+                threading.Thread(target=evaluate, args=(i, paper, cancel), daemon=True).start()
+            try:
+                kind, i, record = finished.get(timeout=1)
+                if running.pop(i, None) is not None:
+                    events.put((kind, record))
+            except queue.Empty:
+                pass
+            now = time.time()
+            for i, (paper, started, cancel) in list(running.items()):
+                if timeout and now - started > timeout:
+                    cancel.set()
+                    del running[i]
+                    events.put(('failed', {'title': paper['title'], 'error': f'timed out after {timeout}s, cancelled'}))
+    finally:
+        events.put(('exit', None))
+
+
+class Progress:
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.time()
+        self.stream = stream
+
+    def update(self, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+        finished = self.done + self.failed
+        elapsed = time.time() - self.start
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (self.total - finished) / rate if rate else float('inf')
+        self.stream.write(
+            f"\r{finished}/{self.total} papers ({self.failed} failed), "
+            f"{rate * 60:.1f}/min, ETA {eta / 60:.1f} min   "
+        )
+        self.stream.flush()
+
+
+def run_eval(inputs=inputs_path, out_path=results_path, workers=4, processes=1, timeout=900, limit=None):
+    """Evaluate every paper in `inputs` that has no result in `out_path` yet.
+
+    Papers run on `workers` threads in each of `processes` processes (papers
+    are split across processes by title hash). Result lines are appended to
+    `out_path` by this process only; failures and timeouts go to
+    `<out_path>.failed` and are retried by the next run. Each shard process
+    builds its own corpus under `<corpus_path>-shard<i>-of-<processes>`,
+    since processes cannot share one store safely; threads share one corpus,
+    so prefer more threads over processes.
+    """
+    with open(inputs) as f:
+        papers = json.load(f)
+    done = completed_titles(out_path)
+    todo = [paper for paper in papers if paper['title'] not in done][:limit]
+    print(f"{len(done)} papers already evaluated, {len(todo)} to go")
+    if not todo:
+        return {'done': 0, 'failed': 0}
+
+    if processes > 1:
+        context = multiprocessing.get_context('spawn')
+        events = context.Queue()
+        shards = [[paper for paper in todo if shard_of(paper['title'], processes) == i] for i in range(processes)]
+        runners = [
+            context.Process(target=_work, args=(shard, workers, timeout, events, (i, processes)), daemon=True)
+            for i, shard in enumerate(shards) if shard
+        ]
+    else:
+        events = queue.Queue()
+        runners = [threading.Thread(target=_work, args=(todo, workers, timeout, events), daemon=True)]
+    for runner in runners:
+        runner.start()
+
+    progress = Progress(len(todo))
+    running = len(runners)
+    with open(out_path, 'a') as out, open(out_path + '.failed', 'a') as failed:
+        while running:
+            try:
+                kind, record = events.get(timeout=5)
+            except queue.Empty:
+                if not any(runner.is_alive() for runner in runners):
+                    # a shard process died without reporting, its papers stay unfinished for the next run
+                    break
+                continue
+            if kind == 'exit':
+                running -= 1
+                continue
+            target = out if kind == 'done' else failed
+            target.write(json.dumps(record) + '\n')
+            target.flush()
+            progress.update(failed=kind == 'failed')
+    print()
+    for runner in runners:
+        runner.join(timeout=1)
+    return {'done': progress.done, 'failed': progress.failed, 'seconds': time.time() - progress.start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable evaluation over papers_cleaned.json')
+    parser.add_argument('--inputs', default=inputs_path)
+    parser.add_argument('--out', default=results_path)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=900, help='seconds per paper, 0 for none')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+    print(run_eval(args.inputs, args.out, args.workers, args.processes, args.timeout, args.limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,38 @@
+import argparse
+import functools
 import json
+import os
 results_path = './papers_cleaned_results.json'
 golden_path = './papers_cleaned.json'
 repo_dump_dir = './1105_test'
 
+
+def normalize_repo(name):
+    """'owner/name' in lower case, from a repo name or a GitHub URL."""
+    name = name.strip().rstrip('/').lower()
+    if name.endswith('.git'):
+        name = name[:-4]
+    return '/'.join(name.split('/')[-2:])
+
+
+@functools.lru_cache(maxsize=None)
+def keyword_repos(keyword):
+    """Repos in the search dump of `keyword`, parsed once per process."""
+    path = repo_dump_dir + '/' + keyword + '.json'
+    if not os.path.exists(path):
+        return frozenset()
+    with open(path) as f:
+        return frozenset(normalize_repo(repo['repo_name']) for repo in json.load(f))
+
+
 def get_repos(keywords):
-    repos = []
-    for keyword in keywords:
-        with open(repo_dump_dir + '/' + keyword + '.json') as f:
-            repos += json.load(f)
-    return [repo['repo_name'] for repo in repos]
+    return frozenset().union(*(keyword_repos(keyword) for keyword in keywords))
+
 
 def get_predict(result):
+    if isinstance(result, list):
+        # reviewer output: repos judged to match, best ranked first
+        return result[0] if result else None
     try:
         result_json = json.loads(result)
     except:
@@ -21,75 +43,119 @@ def get_predict(result):
             return result_json[key]
 
 
-def process_result(path=results_path):
-    gt = {}
-    with open(golden_path) as f:
-        golden_results = json.load(f)
-    for g_result in golden_results:
-        gt[g_result['title']] = g_result['repo_info']['github_url']
-    
+def load_labels(path=golden_path):
     with open(path) as f:
-        lines = f.readlines()
-    hit = 0
-    recall_1 = 0
-    recall_5 = 0
-    search_recall = 0
-    search_right_recall_5_false = 0
-    recall_5_right_hit_false = 0
-    recall_1_right_hit_false = 0
-    for line in lines:
-        data_line = json.loads(line)
-        title = data_line['title']
-        predict = get_predict(data_line['result']['result'])
-        label = gt[title]
-        searcher_right = False
-        reviewer_right = False
-        writer_right = False
-        writer_5_right = False
-        if predict in label:
-            reviewer_right = True
-        
-        writer_5 = data_line['result']['top5']
-        for repo in writer_5:
-            if repo in label:
-                writer_5_right = True
-                break
-        if writer_5[0] in label:
-            writer_right = True
-
-        search_repos = get_repos(data_line['result']['keywords'])
-        for repo in search_repos:
-            if repo in label:
-                searcher_right = True
-                break
-
-        if reviewer_right:
-            hit += 1
-        if writer_right:
-            recall_1 += 1
-        if writer_5_right:
-            recall_5 += 1
-        if searcher_right:
-            search_recall += 1
-        if searcher_right and not writer_5_right:
-            search_right_recall_5_false += 1
-        if writer_5_right and not reviewer_right:
-            recall_5_right_hit_false += 1
-        if writer_right and not reviewer_right:
-            recall_1_right_hit_false += 1
-    
-    print(search_right_recall_5_false)
-    print(recall_5_right_hit_false)
-    print(recall_1_right_hit_false)
-    print(hit)
-    print(recall_5)
-    print(recall_1)
-    print(search_recall)
+        return {g_result['title']: normalize_repo(g_result['repo_info']['github_url']) for g_result in json.load(f)}
+
+
+class Metrics:
+    """Quality and cost counters accumulated one result line at a time."""
 
+    counters = (
+        'queries', 'missing', 'hit', 'recall_1', 'recall_5', 'search_recall',
+        'lost_in_search', 'lost_in_retrieval', 'lost_in_review',
+    )
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.counters, 0)
+        self.seconds = []
+        self.stage_seconds = {}
+        self.llm_calls = 0
+        self.cached_calls = 0
+        self.skipped_reviews = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, label, result):
+        counts = self.counts
+        counts['queries'] += 1
+        if not result:
+            # run() found nothing for the keywords
+            counts['missing'] += 1
+            counts['lost_in_search'] += 1
+            return
+        predict = get_predict(result['result'])
+        top5 = [normalize_repo(repo) for repo in result['top5']]
+        reviewer_right = predict is not None and normalize_repo(predict) == label
+        writer_5_right = label in top5
+        searcher_right = label in get_repos(result['keywords'])
+
+        counts['hit'] += reviewer_right
+        counts['recall_1'] += bool(top5) and top5[0] == label
+        counts['recall_5'] += writer_5_right
+        counts['search_recall'] += searcher_right
+        counts['lost_in_search'] += not searcher_right
+        counts['lost_in_retrieval'] += searcher_right and not writer_5_right
+        counts['lost_in_review'] += writer_5_right and not reviewer_right
+        self._add_cost(result)
+
+    def _add_cost(self, result):
+        for stage, timing in result.get('trace', {}).get('stages', {}).items():
+            self.stage_seconds.setdefault(stage, []).append(timing['seconds'])
+        if 'trace' in result:
+            self.seconds.append(result['trace']['total_seconds'])
+        # keyword and query-text prompts (older results do not record them: two paid calls) plus one per review
+        calls = result.get('calls', [{}, {}]) + result.get('reviews', [])
+        # answers served from the LLM cache cost nothing this run, count them apart
+        paid = [call for call in calls if not call.get('cached')]
+        self.llm_calls += len(paid)
+        self.cached_calls += len(calls) - len(paid)
+        self.skipped_reviews += len(result.get('skipped', []))
+        self.input_tokens += sum(call.get('input_tokens', 0) for call in paid)
+        self.output_tokens += sum(call.get('output_tokens', 0) for call in paid)
+
+    def report(self):
+        n = self.counts['queries'] or 1
+        report = {
+            'queries': self.counts['queries'],
+            'missing': self.counts['missing'],
+            'hit@1 (reviewer)': self.counts['hit'] / n,
+            'recall@1 (retrieval)': self.counts['recall_1'] / n,
+            'recall@5 (retrieval)': self.counts['recall_5'] / n,
+            'search recall': self.counts['search_recall'] / n,
+            'lost in search': self.counts['lost_in_search'],
+            'lost in retrieval': self.counts['lost_in_retrieval'],
+            'lost in review': self.counts['lost_in_review'],
+            'llm calls / query': self.llm_calls / n,
+            'cached llm calls / query': self.cached_calls / n,
+            'skipped reviews': self.skipped_reviews,
+            'input tokens / query': self.input_tokens / n,
+            'output tokens / query': self.output_tokens / n,
+        }
+        if self.seconds:
+            report['seconds / query'] = sum(self.seconds) / len(self.seconds)
+        for stage, seconds in self.stage_seconds.items():
+            report[f'{stage} seconds / query'] = sum(seconds) / len(seconds)
+        return report
+
+
+def process_result(path=results_path, labels=None):
+    """Stream the result lines of `path` and return the labeled metrics."""
+    labels = labels or load_labels()
+    metrics = Metrics()
+    with open(path) as f:
+        for line in f:
+            data_line = json.loads(line)
+            label = labels.get(data_line['title'])
+            if label is None:
+                continue
+            metrics.add(label, data_line['result'])
+    return metrics.report()
 
 
 def main():
-    process_result()
+    parser = argparse.ArgumentParser(description='Score one or more evaluation runs')
+    parser.add_argument('paths', nargs='*', default=[results_path])
+    args = parser.parse_args()
+    labels = load_labels()
+    reports = {path: process_result(path, labels) for path in args.paths}
+    names = list(dict.fromkeys(name for report in reports.values() for name in report))
+    width = max(len(name) for name in names)
+    print(' ' * width + ''.join(f'  {os.path.basename(path):>28}' for path in reports))
+    for name in names:
+        values = [report.get(name) for report in reports.values()]
+        cells = ''.join(f'  {value:>28.3f}' if isinstance(value, float) else f'  {str(value):>28}' for value in values)
+        print(name.ljust(width) + cells)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import random
+import time
+from typing import NamedTuple, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+from ratelimit import budget, resource_for
+from http_cache import default_cache, request_key
+import telemetry
+load_dotenv()
+
+gh_token = os.getenv('GH_TOKEN')
+api_url = os.getenv('GH_API_URL', 'https://api.github.com')
+
+
+class RepoInfo(NamedTuple):
+    """The search-result fields README ingestion reads from a repo, as plain data.
+
+    Only `full_name`, `description`, `stargazers_count` and `pushed_at` are
+    there, which is all `download.load_readme` and the README/HTTP caches
+    touch. It is not a PyGithub Repository: code that calls its methods
+    (`get_contents`, as `search.check_readme` does) or reads other
+    attributes needs the PyGithub object instead.
+    """
+    full_name: str
+    description: Optional[str]
+    stargazers_count: int
+    pushed_at: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, item):
+        return cls(item['full_name'], item.get('description'), item.get('stargazers_count', 0), item.get('pushed_at'))
+
+
+class GithubError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"GitHub request failed ({status}): {message}")
+        self.status = status
+
+
+class AsyncGithub:
+    """asyncio GitHub REST client with one pooled keep-alive session.
+
+    At most `concurrency` requests are in flight at a time; failed requests
+    (connection errors, 5xx, secondary rate limits) are retried up to
+    `retries` times with full-jitter exponential backoff.
+    """
+
+    def __init__(self, token=gh_token, concurrency=50, pool_size=100, retries=4, timeout=30, base_url=api_url):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self._sem = None
+
+    async def __aenter__(self):
+        headers = {'Accept': 'application/vnd.github+json', 'User-Agent': 'Mozilla/5.0'}
+        if self.token:
+            headers['Authorization'] = f'token {self.token}'
+        connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(headers=headers, connector=connector, timeout=self.timeout)
+        self._sem = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(60, 2 ** attempt))
+
+    async def request(self, path, params=None, accept=None, headers=None):
+        """GET `path` and return (status, headers, body); body is text for raw media types, else JSON."""
+        url = path if path.startswith('http') else f'{self.base_url}{path}'
+        headers = {**({'Accept': accept} if accept else {}), **(headers or {})} or None
+        with telemetry.span('github.request', url=url, resource=resource_for(url)) as span:
+            for attempt in range(self.retries + 1):
+                try:
+                    await budget.acquire_async(resource_for(url))
+                    async with self._sem:
+                        async with self.session.get(url, params=params, headers=headers) as resp:
+                            budget.update_from_headers(resp.headers, resource_for(url))
+                            span.set(attempts=attempt + 1, status=resp.status)
+                            if resp.status in (403, 429) and resp.headers.get('X-RateLimit-Remaining') == '0':
+                                wait_time = int(resp.headers.get('X-RateLimit-Reset', time.time())) - time.time()
+                            elif resp.status in (403, 429) and 'Retry-After' in resp.headers:
+                                wait_time = int(resp.headers['Retry-After'])
+                            elif resp.status >= 500:
+                                wait_time = None
+                            else:
+                                if accept and 'raw' in accept and resp.status == 200:
+                                    body = await resp.text()
+                                else:
+                                    body = await resp.json(content_type=None)
+                                span.set(bytes=resp.content_length or 0)
+                                return resp.status, resp.headers, body
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"An error occurred: {e}")
+                    wait_time = None
+                if attempt == self.retries:
+                    break
+                if wait_time is None:
+                    wait_time = self._backoff(attempt)
+                else:
+                    print(f"Rate limit hit. Sleeping for {wait_time} seconds.")
+                wait_time = max(wait_time, 0) + random.uniform(0, 1)
+                span.add('sleep_seconds', wait_time)
+                await asyncio.sleep(wait_time)
+        raise GithubError(None, f"giving up on {url} after {self.retries + 1} attempts")
+
+    async def iter_repositories(self, query, max_results=1000, per_page=100):
+        """Yield the search results for `query` one page (a list of `RepoInfo`) at a time, at most `max_results` repos."""
+        page = 1
+        seen = 0
+        while seen < max_results:
+            status, _, body = await self.request('/search/repositories', params={
+                'q': query, 'sort': 'stars', 'order': 'desc', 'per_page': per_page, 'page': page,
+            })
+            if status != 200:
+                raise GithubError(status, body.get('message') if isinstance(body, dict) else body)
+            items = body.get('items', [])
+            yield [RepoInfo.from_json(item) for item in items][:max_results - seen]
+            seen += len(items)
+            if len(items) < per_page or page * per_page >= min(body.get('total_count', 0), 1000):
+                break
+            page += 1
+
+    async def search_repositories(self, query, max_results=1000, per_page=100):
+        repos = []
+        async for page in self.iter_repositories(query, max_results, per_page):
+            repos += page
+        return repos
+
+    async def get_readme(self, full_name, pushed_at=None):
+        """Raw README text of `full_name`, or None if the repo has none.
+
+        Goes through the HTTP cache like `search.make_request`: served locally
+        when the repo has not been pushed since it was fetched, else
+        revalidated with a conditional request.
+        """
+        accept = 'application/vnd.github.raw'
+        url = f'{self.base_url}/repos/{full_name}/readme'
+        cache = default_cache()
+        key = entry = None
+        if cache is not None:
+            key = request_key(url, None, accept)
+            # SQLite reads and writes stay off the event loop
+            entry = await asyncio.to_thread(cache.get, key)
+            if entry is not None and cache.is_fresh(entry, pushed_at):
+                return cache.hit(entry).text
+        status, headers, body = await self.request(url, accept=accept, headers=entry.validators() if entry else None)
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.update, key, url, entry, status, headers, body)
+            if cached is not None:
+                return cached.text
+        if status == 404:
+            return None
+        if status != 200:
+            raise GithubError(status, body.get('message') if isinstance(body, dict) else body)
+        return body
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import telemetry
+from sqlite_lru import LruTable, connect
+
+cache_path = './cache/http.sqlite'
+# RAGC_HTTP_CACHE=off sends every GitHub request unconditionally
+disabled = os.getenv('RAGC_HTTP_CACHE', 'on').lower() in ('0', 'off', 'false', 'no')
+# seconds an entry is served without asking GitHub when the repo's pushed_at is unknown (0: always revalidate)
+max_age = float(os.getenv('RAGC_HTTP_MAX_AGE', '0'))
+
+
+def request_key(url, params=None, accept=None):
+    payload = json.dumps({'url': url, 'params': params or {}, 'accept': accept}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def parse_time(value):
+    """Seconds since the epoch of a GitHub timestamp ('2024-01-01T00:00:00Z' or a datetime), or None."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        # older PyGithub returns naive datetimes in UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def pushed_at(repo):
+    """`pushed_at` of a `RepoInfo` or PyGithub repository, without making PyGithub fetch a lazy repo."""
+    raw = getattr(repo, '_rawData', None)
+    if raw is not None:
+        return raw.get('pushed_at')
+    return getattr(repo, 'pushed_at', None)
+
+
+class Entry(NamedTuple):
+    status: int
+    headers: dict
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched: float
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8')
+
+    def validators(self):
+        """Headers that make the next request for this entry conditional."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """On-disk cache of GitHub GET responses for conditional requests.
+
+    Bodies are stored with their `ETag`/`Last-Modified` and revalidated with
+    `If-None-Match`/`If-Modified-Since`; a 304 costs no rate limit and no
+    download. Staleness policy: an entry fetched after the repo's last push
+    (`pushed_at`) is served without asking GitHub at all, as is one younger
+    than `max_age` seconds when `pushed_at` is unknown; everything else is
+    revalidated. Entries are evicted least-recently-used beyond
+    `max_entries`. Safe to share between threads.
+    """
+
+    def __init__(self, path=cache_path, max_entries=200000, max_age=max_age):
+        self.path = path
+        self.max_age = max_age
+        # served without a request / revalidated with a 304 / downloaded in full
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.saved_bytes = 0
+        self._lock = threading.Lock()
+        # key -> last read time, written with the next write (or every 256 reads) instead of
+        # committing on each read; a few LRU touches may be lost at exit
+        self._touched = {}
+        self._conn = connect(
+            path,
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB, '
+            'etag TEXT, last_modified TEXT, fetched REAL, last_used REAL)',
+            'CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)',
+        )
+        self._table = LruTable(self._conn, 'responses', ['key'], max_entries)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, headers, body, etag, last_modified, fetched FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= 256:
+                self._flush_touched()
+                self._conn.commit()
+        status, headers, body, etag, last_modified, fetched = row
+        return Entry(status, json.loads(headers), bytes(body), etag, last_modified, fetched)
+
+    def _flush_touched(self):
+        # caller holds the lock and commits
+        if self._touched:
+            self._conn.executemany('UPDATE responses SET last_used = ? WHERE key = ?',
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def is_fresh(self, entry, pushed_at=None):
+        """Whether `entry` can be served without a request under the staleness policy."""
+        pushed = parse_time(pushed_at)
+        if pushed is not None:
+            return pushed <= entry.fetched
+        return time.time() - entry.fetched < self.max_age
+
+    def put(self, key, url, status, headers, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        headers = {name.lower(): value for name, value in headers.items() if name.lower() in ('content-type', 'etag', 'last-modified')}
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._table.upsert(
+                ('key', 'url', 'status', 'headers', 'body', 'etag', 'last_modified', 'fetched', 'last_used'),
+                [(key, url, status, json.dumps(headers), body, headers.get('etag'), headers.get('last-modified'), now, now)],
+            )
+            self._conn.commit()
+
+    def hit(self, entry):
+        """Count `entry` as served by the staleness policy and return it."""
+        with self._lock:
+            self.hits += 1
+            self.saved_bytes += len(entry.body)
+        telemetry.count('http_cache.hits')
+        return entry
+
+    def update(self, key, url, entry, status, headers, body):
+        """Record the response to a request made with `entry.validators()`.
+
+        Returns the entry to serve instead of the response (on 304), or None
+        when the response itself should be used.
+        """
+        if status == 304 and entry is not None:
+            with self._lock:
+                self._flush_touched()
+                self._conn.execute('UPDATE responses SET fetched = ? WHERE key = ?', (time.time(), key))
+                self._conn.commit()
+                self.not_modified += 1
+                self.saved_bytes += len(entry.body)
+            telemetry.count('http_cache.not_modified')
+            return entry
+        if status == 200:
+            self.put(key, url, status, headers, body)
+            with self._lock:
+                self.misses += 1
+            telemetry.count('http_cache.misses')
+        return None
+
+    def stats(self):
+        total = self.hits + self.not_modified + self.misses
+        return {
+            'hits': self.hits,
+            'not_modified': self.not_modified,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.not_modified) / total if total else 0.0,
+            'saved_bytes': self.saved_bytes,
+            'entries': self._table.size,
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """The process-wide HTTP cache, or None with RAGC_HTTP_CACHE=off."""
+    global _default
+    if disabled:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = HttpCache()
+        return _default
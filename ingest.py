@@ -0,0 +1,225 @@
+import contextvars
+import functools
+import queue
+import re
+import threading
+import time
+
+import openai
+import tiktoken
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import store
+import telemetry
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    wait_random_exponential,
+)  # for exponential backoff
+
+_DONE = object()
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # offline: the BPE file could not be fetched, fall back to ~4 chars/token
+        print(f"tiktoken unavailable, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# sections that describe how to cite/license/credit a project rather than what it does; install and
+# requirements sections stay, they name the language and frameworks a repo is matched on
+boilerplate_sections = re.compile(
+    r'^(licen[cs]e|citation|cite|'
+    r'bibtex|contribut(e|ing|ors)|acknowledge?ments?|sponsors?|star history|contact|changelog)\b',
+    re.IGNORECASE,
+)
+heading = re.compile(r'^(#{1,6})\s*(.*?)\s*#*\s*$')
+# lines that only hold badges/images, e.g. [![build](...)](...) or <img src=...>
+badge_line = re.compile(r'^\s*((\[!\[[^\]]*\]\([^)]*\)\]\([^)]*\)|!\[[^\]]*\]\([^)]*\)|<img[^>]*>|</?(p|div|a)[^>]*>)\s*)+$', re.IGNORECASE)
+
+
+def strip_boilerplate(text):
+    """Drop badge/image-only lines and license, citation, contributing, ... sections from a README."""
+    lines = []
+    skip_level = None
+    in_fence = False
+    for line in text.splitlines():
+        if line.lstrip().startswith('```'):
+            in_fence = not in_fence
+        match = None if in_fence else heading.match(line)
+        if match:
+            level = len(match.group(1))
+            if skip_level is not None and level <= skip_level:
+                skip_level = None
+            if skip_level is None and boilerplate_sections.match(match.group(2)):
+                skip_level = level
+        if skip_level is not None or badge_line.match(line):
+            continue
+        lines.append(line)
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+class ReadmeChunker:
+    """Split a README Document into token-sized chunks after stripping boilerplate.
+
+    At most `max_tokens` tokens of each README are kept. Every chunk carries
+    the metadata of the README plus its `chunk` number, so hits can be mapped
+    back to their repo through `repo_name`.
+    """
+
+    def __init__(self, chunk_tokens=256, overlap_tokens=32, max_tokens=2048):
+        self.max_tokens = max_tokens
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=overlap_tokens,
+            length_function=count_tokens,
+        )
+
+    def __call__(self, doc):
+        text = strip_boilerplate(doc.page_content) or doc.page_content
+        chunks = []
+        budget = self.max_tokens
+        for chunk in self.splitter.split_text(text):
+            budget -= count_tokens(chunk)
+            if budget < 0 and chunks:
+                break
+            chunks.append(Document(page_content=chunk, metadata={**doc.metadata, 'chunk': len(chunks)}))
+        return chunks
+
+
+class BatchIndexer:
+    """Single consumer that embeds queued Documents in token-bounded batches.
+
+    Fetch workers call `put` (which blocks once `queue_size` documents are
+    waiting), the indexer thread groups them into batches of at most
+    `batch_tokens` tokens / `batch_size` documents and appends each batch to
+    the FAISS store with one `add_documents` call. With a `chunker` each
+    README is split into chunks (see `ReadmeChunker`) before it is queued.
+    A batch that cannot be indexed is dropped; `failed_repos` holds the repos
+    that lost documents that way, so the caller can fetch them again.
+    `tokens_per_repo` counts the tokens sent to the embedding model: chunks
+    served from a `CachedEmbeddings` cache are left out. With
+    `lock`, each batch is added to the store holding it (see
+    `store.add_documents`), and `on_batch(docs, ids)` is called after every
+    batch that was added.
+    """
+
+    def __init__(self, db: FAISS, batch_tokens=100000, batch_size=256, queue_size=64, linger=0.2, chunker=None,
+                 lock=None, on_batch=None):
+        self.db = db
+        self.chunker = chunker
+        self.lock = lock
+        self.on_batch = on_batch
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batches = []
+        self.errors = 0
+        self.failed_repos = set()
+        # repo_name -> tokens sent to the embedding model
+        self.repo_tokens = {}
+        self._thread = threading.Thread(target=self._run, name='batch-indexer', daemon=True)
+        self._thread.start()
+
+    def put(self, doc):
+        # the batch is indexed in the context of its first put, so its spans join that caller's trace
+        context = contextvars.copy_context()
+        docs = self.chunker(doc) if self.chunker else [doc]
+        for doc in docs:
+            self.queue.put((doc, count_tokens(doc.page_content), context))
+
+    def close(self):
+        self.queue.put(_DONE)
+        self._thread.join()
+        return self.stats()
+
+    @retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
+    def _flush(self, docs):
+        texts = [doc.page_content for doc in docs]
+        embed_new = getattr(self.db.embeddings, 'embed_new', None)
+        if embed_new is None:
+            vectors, new = self.db.embeddings.embed_documents(texts), [True] * len(texts)
+        else:
+            vectors, new = embed_new(texts)
+        return store.add_documents(self.db, docs, lock=self.lock, vectors=vectors), new
+
+    def _index(self, batch, doc_tokens):
+        depth = self.queue.qsize()
+        tokens = sum(doc_tokens)
+        start = time.time()
+        try:
+            with telemetry.span('index.batch', docs=len(batch), tokens=tokens, queue_depth=depth):
+                ids, new = self._flush(batch)
+        except Exception as e:
+            self.errors += len(batch)
+            self.failed_repos.update(doc.metadata.get('repo_name') for doc in batch)
+            print(f"Indexing batch of {len(batch)} failed: {e}")
+            return
+        for doc, count, embedded in zip(batch, doc_tokens, new):
+            repo_name = doc.metadata.get('repo_name')
+            self.repo_tokens[repo_name] = self.repo_tokens.get(repo_name, 0) + (count if embedded else 0)
+        if self.on_batch is not None:
+            self.on_batch(batch, ids)
+        elapsed = time.time() - start
+        self.batches.append({'docs': len(batch), 'tokens': tokens, 'seconds': elapsed, 'queue_depth': depth})
+        print(f"Indexed {len(batch)} docs ({tokens} tokens) in {elapsed:.2f}s, queue depth {depth}")
+
+    def _run(self):
+        pending = None
+        done = False
+        while not done:
+            item = pending or self.queue.get()
+            pending = None
+            if item is _DONE:
+                break
+            batch = [item[0]]
+            doc_tokens = [item[1]]
+            tokens = item[1]
+            context = item[2]
+            deadline = time.time() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                if tokens + item[1] > self.batch_tokens:
+                    pending = item
+                    break
+                batch.append(item[0])
+                doc_tokens.append(item[1])
+                tokens += item[1]
+            context.run(self._index, batch, doc_tokens)
+
+    def stats(self):
+        docs = sum(b['docs'] for b in self.batches)
+        seconds = sum(b['seconds'] for b in self.batches)
+        return {
+            'batches': len(self.batches),
+            'docs': docs,
+            'tokens': sum(b['tokens'] for b in self.batches),
+            'errors': self.errors,
+            'failed_repos': sorted(self.failed_repos),
+            'index_seconds': seconds,
+            'max_queue_depth': max((b['queue_depth'] for b in self.batches), default=0),
+            'batch_latency': [b['seconds'] for b in self.batches],
+            'repos': len(self.repo_tokens),
+            'tokens_per_repo': sum(self.repo_tokens.values()) / len(self.repo_tokens) if self.repo_tokens else 0.0,
+            'max_tokens_per_repo': max(self.repo_tokens.values(), default=0),
+        }
@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, List
+
+import numpy as np
+from scipy import sparse
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+index_file = 'bm25.npz'
+
+_token_re = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _token_re.findall(text.lower())
+
+
+def top_k(scores, k):
+    """Indices of the `k` largest positive entries of `scores`, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return candidates[scores[candidates] > 0]
+
+
+class LexicalIndex:
+    """Incrementally updatable BM25 index over the documents of one vector store.
+
+    Term counts are appended as COO triplets; on the first query after a
+    change they are turned into a CSR document-term matrix that already holds
+    the IDF- and length-normalized BM25 weight of every (doc, term) pair, so
+    scoring a batch of queries is one sparse matrix product. Only docstore ids
+    are kept, matching Documents are read back from the FAISS docstore.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.positions = {}
+        self.vocab = {}
+        # int32 COO triplets, one per distinct (doc, term) pair
+        self._rows = array('i')
+        self._cols = array('i')
+        self._tfs = array('i')
+        self._doc_len = array('i')
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_documents(self, docs, ids):
+        with self._lock:
+            for doc, doc_id in zip(docs, ids):
+                doc_idx = len(self.ids)
+                tokens = tokenize(doc.page_content)
+                self.positions[doc_id] = doc_idx
+                self.ids.append(doc_id)
+                self._doc_len.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    self._rows.append(doc_idx)
+                    self._cols.append(self.vocab.setdefault(term, len(self.vocab)))
+                    self._tfs.append(tf)
+            self._matrix = None
+
+    def _weights(self):
+        with self._lock:
+            if self._matrix is not None:
+                return self._matrix
+            n_docs, n_terms = len(self.ids), len(self.vocab)
+            rows = np.array(self._rows, dtype=np.int32)
+            cols = np.array(self._cols, dtype=np.int32)
+            tfs = np.array(self._tfs, dtype=np.float32)
+            doc_len = np.array(self._doc_len, dtype=np.float32)
+            df = np.bincount(cols, minlength=n_terms)
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * doc_len / max(doc_len.mean(), 1.0)) if n_docs else doc_len
+            data = idf[cols] * tfs * (self.k1 + 1) / (tfs + norm[rows])
+            self._matrix = sparse.csr_matrix((data, (rows, cols)), shape=(n_docs, n_terms), dtype=np.float32)
+            return self._matrix
+
+    def _query_matrix(self, queries, n_terms):
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            # terms added after the weights were built are not in the matrix yet
+            terms = {self.vocab[t] for t in tokenize(query) if self.vocab.get(t, n_terms) < n_terms}
+            rows += [i] * len(terms)
+            cols += terms
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(queries), n_terms)
+        )
+
+    def score_batch(self, queries):
+        """Dense (len(queries), len(self)) array of BM25 scores."""
+        weights = self._weights()
+        if weights.shape[0] == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+        return (self._query_matrix(queries, weights.shape[1]) @ weights.T).toarray()
+
+    def search_batch(self, queries, k=4):
+        """Top `k` (docstore id, score) pairs for each query."""
+        results = []
+        for scores in self.score_batch(queries):
+            results.append([(self.ids[i], float(scores[i])) for i in top_k(scores, k)])
+        return results
+
+    def search(self, query, k=4):
+        return self.search_batch([query], k)[0]
+
+    def save(self, path):
+        with self._lock:
+            terms = sorted(self.vocab, key=self.vocab.get)
+            arrays = {
+                'params': np.asarray([self.k1, self.b]),
+                'ids': np.asarray(self.ids, dtype=str),
+                'terms': np.asarray(terms, dtype=str),
+                'rows': np.array(self._rows, dtype=np.int32),
+                'cols': np.array(self._cols, dtype=np.int32),
+                'tfs': np.array(self._tfs, dtype=np.int32),
+                'doc_len': np.array(self._doc_len, dtype=np.int32),
+            }
+        tmp_path = os.path.join(path, index_file + '.tmp.npz')
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, os.path.join(path, index_file))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(os.path.join(path, index_file), allow_pickle=False) as data:
+            index = cls(k1=float(data['params'][0]), b=float(data['params'][1]))
+            index.ids = data['ids'].tolist()
+            index.positions = {doc_id: i for i, doc_id in enumerate(index.ids)}
+            index.vocab = {term: i for i, term in enumerate(data['terms'].tolist())}
+            for name in ('rows', 'cols', 'tfs', 'doc_len'):
+                getattr(index, '_' + name).frombytes(data[name].astype(np.int32).tobytes())
+        return index
+
+    @classmethod
+    def from_docstore(cls, db):
+        index = cls()
+        items = list(db.docstore._dict.items())
+        index.add_documents([doc for _, doc in items], [doc_id for doc_id, _ in items])
+        return index
+
+    def as_retriever(self, db, k=4):
+        return LexicalRetriever(index=self, db=db, k=k)
+
+
+class LexicalRetriever(BaseRetriever):
+    """BM25 retriever backed by a persisted `LexicalIndex`, usable inside `EnsembleRetriever`."""
+
+    index: Any
+    db: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.db.docstore.search(doc_id) for doc_id, _ in self.index.search(query, self.k)]
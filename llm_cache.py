@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+import telemetry
+from sqlite_lru import LruTable, connect
+
+cache_path = './cache/llm.sqlite'
+# RAGC_LLM_CACHE=off sends every prompt to the model (and turns off autogen's cache)
+disabled = os.getenv('RAGC_LLM_CACHE', 'on').lower() in ('0', 'off', 'false', 'no')
+# autogen keeps its own disk cache under ./.cache/<seed>
+autogen_cache_seed = None if disabled else int(os.getenv('RAGC_AUTOGEN_CACHE_SEED', '41'))
+
+# model parameters that change the completion, part of the cache key
+key_params = ('model_name', 'temperature', 'max_tokens', 'top_p', 'seed', 'n', 'stop', 'model_kwargs')
+
+
+def prompt_key(model, params, prompt):
+    payload = json.dumps({'model': model, 'params': params, 'prompt': prompt}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CachedLLM:
+    """On-disk cache in front of a LangChain chat model's `invoke`.
+
+    Responses are keyed by (model, parameters, rendered prompt), expire after
+    `ttl` seconds and are evicted least-recently-used beyond `max_entries`.
+    `invoke(prompt, bypass=True)` (or `bypass` on the instance) always asks
+    the model and refreshes the entry. Safe to share between threads.
+    """
+
+    def __init__(self, llm, path=cache_path, ttl=30 * 24 * 3600, max_entries=100000, bypass=disabled):
+        self.llm = llm
+        self.model = getattr(llm, 'model_name', None) or type(llm).__name__
+        self.params = {name: getattr(llm, name) for name in key_params if getattr(llm, name, None) is not None}
+        self.path = path
+        self.ttl = ttl
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        # model time the hits would have cost
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = connect(
+            path,
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, model TEXT, content TEXT, usage TEXT, seconds REAL, created REAL, last_used REAL)',
+            'CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)',
+        )
+        self._table = LruTable(self._conn, 'responses', ['key'], max_entries)
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT content, usage, seconds FROM responses WHERE key = ? AND created > ?', (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+                self._conn.commit()
+        return row
+
+    def _store(self, key, message, seconds):
+        now = time.time()
+        usage = getattr(message, 'usage_metadata', None)
+        with self._lock:
+            # a bypass refresh or a re-stored expired key replaces its row; expired entries are evicted first
+            self._table.upsert(
+                ('key', 'model', 'content', 'usage', 'seconds', 'created', 'last_used'),
+                [(key, self.model, message.content, json.dumps(usage) if usage else None, seconds, now, now)],
+                expired=('created <= ?', (now - self.ttl,)),
+            )
+            self._conn.commit()
+
+    def invoke(self, prompt, bypass=None, **kwargs):
+        with telemetry.span('llm.invoke', model=self.model, prompt_chars=len(str(prompt))) as span:
+            message = self._invoke(prompt, bypass, **kwargs)
+            usage = getattr(message, 'usage_metadata', None) or {}
+            span.set(
+                cached=bool(message.response_metadata.get('cached')),
+                input_tokens=usage.get('input_tokens', 0),
+                output_tokens=usage.get('output_tokens', 0),
+            )
+            return message
+
+    def _invoke(self, prompt, bypass=None, **kwargs):
+        key = prompt_key(self.model, {**self.params, **kwargs}, str(prompt))
+        if not (self.bypass if bypass is None else bypass):
+            row = self._lookup(key)
+            if row is not None:
+                content, usage, seconds = row
+                with self._lock:
+                    self.hits += 1
+                    self.saved_seconds += seconds
+                return AIMessage(
+                    content=content,
+                    usage_metadata=json.loads(usage) if usage else None,
+                    response_metadata={'cached': True},
+                )
+        start = time.time()
+        message = self.llm.invoke(prompt, **kwargs)
+        seconds = time.time() - start
+        with self._lock:
+            self.misses += 1
+        self._store(key, message, seconds)
+        return message
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'model': self.model,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'saved_seconds': self.saved_seconds,
+            'entries': self._table.size,
+        }
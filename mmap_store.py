@@ -0,0 +1,217 @@
+import json
+import mmap
+import os
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+format_version = 1
+meta_file = 'meta.json'
+faiss_file = 'index.faiss'
+docs_file = 'docs.jsonl'
+offsets_file = 'docs.idx'
+ids_file = 'ids.txt'
+vectors_file = 'embeddings.f32'
+
+# zero-copy flat codes where this faiss build supports it
+mmap_flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def is_mmap_store(path):
+    return os.path.exists(os.path.join(path, meta_file))
+
+
+class _DocView(Mapping):
+    """Read-only `_dict` stand-in so code written against InMemoryDocstore keeps working."""
+
+    def __init__(self, docstore):
+        self._docstore = docstore
+
+    def __getitem__(self, doc_id):
+        doc = self._docstore.search(doc_id)
+        if isinstance(doc, str):
+            raise KeyError(doc_id)
+        return doc
+
+    def __iter__(self):
+        for doc_id in self._docstore.ids:
+            if doc_id not in self._docstore.deleted:
+                yield doc_id
+        yield from self._docstore.overlay
+
+    def __len__(self):
+        return len(self._docstore.ids) - len(self._docstore.deleted) + len(self._docstore.overlay)
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """Docstore that reads Documents lazily from an offset-indexed JSONL file.
+
+    The JSONL file is memory-mapped, so opening a store reads only the id
+    list and processes opening the same store share its pages. Documents
+    added after opening live in `overlay` until the store is saved again.
+    """
+
+    def __init__(self, path=None, count=0):
+        self.path = os.path.abspath(path) if path else None
+        self.ids = []
+        self.positions = {}
+        self.overlay = {}
+        self.deleted = set()
+        # number of overlay documents already appended to the files under `path`
+        self.appended = 0
+        self._offsets = None
+        self._data = None
+        if path and count:
+            with open(os.path.join(path, ids_file)) as f:
+                self.ids = f.read().split('\n')[:count]
+            self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            self._offsets = np.memmap(os.path.join(path, offsets_file), dtype=np.uint64, mode='r', shape=(count + 1,))
+            with open(os.path.join(path, docs_file), 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._dict = _DocView(self)
+
+    @property
+    def dirty(self):
+        """True when the files under `path` can no longer be appended to."""
+        return bool(self.deleted)
+
+    def _read(self, i):
+        record = json.loads(self._data[int(self._offsets[i]):int(self._offsets[i + 1])])
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+    def search(self, search):
+        if search in self.overlay:
+            return self.overlay[search]
+        i = self.positions.get(search)
+        if i is None or search in self.deleted:
+            return f"ID {search} not found."
+        return self._read(i)
+
+    def add(self, texts):
+        overlapping = [doc_id for doc_id in texts if doc_id in self.overlay or doc_id in self.positions]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.overlay.update(texts)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            if doc_id in self.overlay:
+                del self.overlay[doc_id]
+                self.appended = min(self.appended, len(self.overlay))
+                self.deleted.add(doc_id)
+            elif doc_id in self.positions:
+                self.deleted.add(doc_id)
+            else:
+                raise ValueError(f"ID {doc_id} not found.")
+
+
+def _record(doc_id, doc):
+    return (json.dumps({'id': doc_id, 'page_content': doc.page_content, 'metadata': doc.metadata}) + '\n').encode('utf-8')
+
+
+def _write_meta(path, count, dim):
+    tmp_path = os.path.join(path, meta_file + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'format': format_version, 'count': count, 'dim': dim}, f)
+    os.replace(tmp_path, os.path.join(path, meta_file))
+
+
+def _write_ids(path, ids):
+    tmp_path = os.path.join(path, ids_file + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(ids))
+    os.replace(tmp_path, os.path.join(path, ids_file))
+
+
+def _write_index(index, path):
+    tmp_path = os.path.join(path, faiss_file + '.tmp')
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, os.path.join(path, faiss_file))
+
+
+def _write_vectors(f, chunks, start):
+    """Write the rows from `start` on of the row-stacked `chunks` to `f`."""
+    row = 0
+    for chunk in chunks:
+        if row + len(chunk) > start:
+            f.write(np.ascontiguousarray(chunk[max(start - row, 0):], dtype=np.float32).tobytes())
+        row += len(chunk)
+
+
+def write_store(db, path, chunks):
+    """Write `db` under `path`; `chunks` are float32 arrays that row-stack to its raw (ntotal, d) embeddings.
+
+    When `db` was opened from `path` and only had documents added since, the
+    new documents are appended instead of rewriting every file. `meta.json`
+    is written last, readers only trust the first `count` entries of each file.
+    """
+    os.makedirs(path, exist_ok=True)
+    count = db.index.ntotal
+    docstore = db.docstore
+    appendable = (
+        isinstance(docstore, MmapDocstore) and docstore.path == os.path.abspath(path) and not docstore.dirty
+        and len(docstore.ids) + len(docstore.overlay) == count
+    )
+    if appendable:
+        # documents already on disk; anything a crashed writer left past them is overwritten
+        start = len(docstore.ids) + docstore.appended
+        new_ids = [db.index_to_docstore_id[i] for i in range(start, count)]
+        committed = np.fromfile(os.path.join(path, offsets_file), dtype=np.uint64, count=start + 1)
+        offsets = []
+        with open(os.path.join(path, docs_file), 'r+b') as f:
+            f.seek(int(committed[start]))
+            f.truncate()
+            for doc_id in new_ids:
+                f.write(_record(doc_id, docstore.overlay[doc_id]))
+                offsets.append(f.tell())
+        with open(os.path.join(path, offsets_file), 'r+b') as f:
+            f.seek((start + 1) * 8)
+            f.truncate()
+            f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+        with open(os.path.join(path, vectors_file), 'r+b') as f:
+            f.seek(start * db.index.d * 4)
+            f.truncate()
+            _write_vectors(f, chunks, start)
+        _write_ids(path, [db.index_to_docstore_id[i] for i in range(count)])
+        docstore.appended = len(docstore.overlay)
+    else:
+        ids = [db.index_to_docstore_id[i] for i in range(count)]
+        offsets = [0]
+        with open(os.path.join(path, docs_file + '.tmp'), 'wb') as f:
+            for doc_id in ids:
+                f.write(_record(doc_id, docstore.search(doc_id)))
+                offsets.append(f.tell())
+        np.asarray(offsets, dtype=np.uint64).tofile(os.path.join(path, offsets_file + '.tmp'))
+        with open(os.path.join(path, vectors_file + '.tmp'), 'wb') as f:
+            _write_vectors(f, chunks, 0)
+        for name in (docs_file, offsets_file, vectors_file):
+            os.replace(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+        _write_ids(path, ids)
+        if isinstance(docstore, MmapDocstore) and docstore.path is None and not docstore.ids and not docstore.dirty:
+            # a new store written for the first time: later saves can append
+            docstore.path = os.path.abspath(path)
+            docstore.appended = len(docstore.overlay)
+    _write_index(db.index, path)
+    _write_meta(path, count, db.index.d)
+    # the directory no longer needs (or should offer) the pickled docstore
+    legacy = os.path.join(path, 'index.pkl')
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+def read_store(path, writable=False):
+    """Return (index, docstore, index_to_docstore_id, vectors) for the store under `path`.
+
+    Read-only stores memory-map the FAISS index; `writable` ones load it into
+    RAM so documents can be added. `vectors` is a read-only memmap.
+    """
+    with open(os.path.join(path, meta_file)) as f:
+        meta = json.load(f)
+    count, dim = meta['count'], meta['dim']
+    index = faiss.read_index(os.path.join(path, faiss_file), 0 if writable else mmap_flags)
+    docstore = MmapDocstore(path, count)
+    vectors = np.memmap(os.path.join(path, vectors_file), dtype=np.float32, mode='r', shape=(count, dim)) if count else np.zeros((0, dim), dtype=np.float32)
+    return index, docstore, dict(enumerate(docstore.ids)), vectors
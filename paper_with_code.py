@@ -5,10 +5,12 @@ import time
 import os
 from github import Github
 from search import check_readme
+from ratelimit import budget
+from gh_async import api_url
 from dotenv import load_dotenv
 load_dotenv()
 gh_token = os.getenv('GH_TOKEN')
-g = Github(gh_token)
+g = Github(gh_token, base_url=api_url)
 
 paper_code = './links-between-papers-and-code.json'
 paper_abstract = './papers-with-abstracts.json'
@@ -57,7 +59,9 @@ def check_data(data_path):
             continue
         repo_name = '/'.join(repo_url.split('/')[-2:])
         try:
+            budget.acquire('core')
             repo = g.get_repo(repo_name)
+            budget.update_from_github(g, 'core')
             _, __ = check_readme(repo, least_star=50)
             if _:
                 print(repo_name)
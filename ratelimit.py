@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import telemetry
+
+
+class RateLimitBudget:
+    """Process-wide view of the GitHub `core` and `search` rate-limit buckets.
+
+    The buckets are refreshed from the `X-RateLimit-*` headers of responses we
+    already receive, never from extra `/rate_limit` probes. Callers reserve a
+    request with `acquire` (or `acquire_async`), which returns immediately
+    while plenty of budget is left, spaces requests evenly over the time to
+    reset once less than `pace_below` of the limit remains, and pauses until
+    the reset when a bucket is empty.
+    """
+
+    def __init__(self, pace_below=0.1, reserve=1):
+        self.pace_below = pace_below
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        # limit -1 means we have not seen a response for that bucket yet
+        self._buckets = {
+            'core': {'remaining': None, 'limit': -1, 'reset': 0.0, 'next': 0.0},
+            'search': {'remaining': None, 'limit': -1, 'reset': 0.0, 'next': 0.0},
+        }
+        self.waits = 0
+        self.waited = 0.0
+
+    def update(self, resource, remaining, limit, reset):
+        with self._lock:
+            bucket = self._buckets.setdefault(resource, {'remaining': None, 'limit': -1, 'reset': 0.0, 'next': 0.0})
+            # responses can arrive out of order; never raise remaining within the same window
+            if bucket['remaining'] is None or reset != bucket['reset'] or remaining < bucket['remaining']:
+                bucket['remaining'] = remaining
+            bucket['limit'] = limit
+            bucket['reset'] = reset
+
+    def update_from_headers(self, headers, resource='core'):
+        if 'X-RateLimit-Remaining' not in headers or 'X-RateLimit-Reset' not in headers:
+            return
+        self.update(
+            headers.get('X-RateLimit-Resource', resource),
+            int(float(headers['X-RateLimit-Remaining'])),
+            int(float(headers.get('X-RateLimit-Limit', -1))),
+            float(headers['X-RateLimit-Reset']),
+        )
+
+    def update_from_github(self, g, resource='core'):
+        """Read the headers PyGithub kept from its last response (no request is made).
+
+        `g` is a `Github` client or any object it returned (a repository, a
+        paginated list): those answer through the requester of the client
+        that created them, which is the one holding the fresh headers.
+        """
+        requester = getattr(g, '_requester', None) or g.requester
+        remaining, limit = requester.rate_limiting
+        if limit >= 0 and requester.rate_limiting_resettime:
+            self.update(resource, remaining, limit, float(requester.rate_limiting_resettime))
+
+    def _reserve(self, resource):
+        """Claim one request from `resource` and return how long the caller must wait first."""
+        with self._lock:
+            bucket = self._buckets[resource]
+            now = time.time()
+            if bucket['remaining'] is None or now >= bucket['reset']:
+                # unknown or already reset: let the request through and learn from its headers
+                if bucket['remaining'] is not None and bucket['limit'] > 0:
+                    bucket['remaining'] = bucket['limit']
+                    bucket['reset'] = now + (60 if resource == 'search' else 3600)
+                return 0.0
+            window = bucket['reset'] - now
+            if bucket['remaining'] <= self.reserve:
+                delay = window + 1
+                bucket['remaining'] = bucket['limit'] if bucket['limit'] > 0 else None
+                bucket['reset'] = now + delay + (60 if resource == 'search' else 3600)
+                bucket['next'] = now + delay
+            elif bucket['limit'] > 0 and bucket['remaining'] < bucket['limit'] * self.pace_below:
+                start = max(now, bucket['next'])
+                bucket['next'] = start + window / bucket['remaining']
+                delay = start - now
+            else:
+                delay = max(bucket['next'] - now, 0.0)
+            if bucket['remaining'] is not None:
+                bucket['remaining'] -= 1
+            if delay > 0:
+                self.waits += 1
+                self.waited += delay
+            return delay
+
+    def acquire(self, resource='core'):
+        delay = self._reserve(resource)
+        if delay > 1:
+            print(f"Rate limit budget for {resource} low, sleeping for {delay:.1f} seconds")
+        if delay > 0:
+            telemetry.count(f'ratelimit.{resource}.sleep_seconds', delay)
+            time.sleep(delay)
+
+    async def acquire_async(self, resource='core'):
+        delay = self._reserve(resource)
+        if delay > 1:
+            print(f"Rate limit budget for {resource} low, sleeping for {delay:.1f} seconds")
+        if delay > 0:
+            telemetry.count(f'ratelimit.{resource}.sleep_seconds', delay)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buckets': {name: dict(bucket) for name, bucket in self._buckets.items()},
+                'waits': self.waits,
+                'waited': self.waited,
+            }
+
+
+budget = RateLimitBudget()
+
+
+def resource_for(url):
+    return 'search' if '/search/' in url else 'core'
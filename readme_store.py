@@ -0,0 +1,260 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from langchain_core.documents import Document
+
+from embedding_cache import content_hash
+
+store_path = './cache/readmes.sqlite'
+# queue markers for the writer thread
+_stop = object()
+_retry = object()
+
+
+class ReadmeStore:
+    """Durable store of every fetched README, keyed by `repo_name`.
+
+    READMEs are kept zlib-compressed in SQLite, content-addressed by sha256 so
+    forks with the same README share one row. Any number of threads may
+    `put`; a single writer thread drains the queue and commits in batches,
+    and an upsert whose content hash has not changed only refreshes the
+    repo's metadata. `get` is a primary-key lookup that also sees puts not
+    yet written, and `iter_documents` streams everything back in bulk so a
+    vector store can be rebuilt without touching the network. Rows whose
+    write failed are kept and retried with the next batch; `flush` retries
+    them once more and raises if they still cannot be written.
+    """
+
+    def __init__(self, path=store_path, batch_size=256, queue_size=1024):
+        self.path = path
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self._lock = threading.Lock()
+        # repo_name -> row queued but not yet committed
+        self._pending = {}
+        # rows of the last failed write and its error, retried with the next batch
+        self._failed = []
+        self._error = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, content BLOB)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS readmes ('
+            'repo_name TEXT PRIMARY KEY, hash TEXT, repo_desc TEXT, star INTEGER, pushed_at TEXT, fetched REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS readmes_hash ON readmes (hash)')
+        self._conn.commit()
+        self._closed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def put(self, repo_name, content, repo_desc=None, star=None, pushed_at=None):
+        """Queue an upsert of `repo_name`; blocks only when the writer is `queue_size` rows behind."""
+        if self._closed:
+            raise RuntimeError("README store is closed")
+        row = (repo_name, content_hash(content), content, repo_desc, star, pushed_at, time.time())
+        with self._lock:
+            self._pending[repo_name] = row
+        self._queue.put(row)
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                rows = self._failed + [row for row in batch if row is not _stop and row is not _retry]
+                self._failed = []
+            try:
+                if rows:
+                    self._write(conn, rows)
+                written = rows
+            except Exception as e:
+                print(f"README store write failed, {len(rows)} rows kept for retry: {e}")
+                written = []
+                with self._lock:
+                    self._failed = rows
+                    self._error = e
+            finally:
+                with self._lock:
+                    for row in written:
+                        if self._pending.get(row[0]) is row:
+                            del self._pending[row[0]]
+                for _ in batch:
+                    self._queue.task_done()
+            if _stop in batch:
+                break
+        conn.close()
+
+    def _write(self, conn, rows):
+        # a repo queued twice in one batch: the last put wins
+        latest = {row[0]: row for row in rows}
+        names = list(latest)
+        known = {}
+        for i in range(0, len(names), 500):
+            part = names[i:i + 500]
+            known.update(conn.execute(
+                f'SELECT repo_name, hash FROM readmes WHERE repo_name IN ({",".join("?" * len(part))})', part
+            ).fetchall())
+        changed = [row for name, row in latest.items() if known.get(name) != row[1]]
+        conn.executemany(
+            'INSERT OR IGNORE INTO contents (hash, content) VALUES (?, ?)',
+            [(digest, zlib.compress(content.encode('utf-8'))) for _, digest, content, *_ in changed],
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO readmes (repo_name, hash, repo_desc, star, pushed_at, fetched) VALUES (?, ?, ?, ?, ?, ?)',
+            [(name, digest, desc, star, pushed_at, fetched) for name, digest, _, desc, star, pushed_at, fetched in latest.values()],
+        )
+        conn.commit()
+        with self._lock:
+            self.inserted += sum(name not in known for name in latest)
+            self.updated += sum(name in known for name in (row[0] for row in changed))
+            self.unchanged += len(latest) - len(changed)
+
+    def flush(self):
+        """Wait until every queued put is committed; raises if some could not be written."""
+        self._queue.join()
+        if self._failed and not self._closed:
+            self._queue.put(_retry)
+            self._queue.join()
+        with self._lock:
+            if self._failed:
+                raise RuntimeError(f"{len(self._failed)} READMEs could not be written to {self.path}: {self._error}")
+
+    def get(self, repo_name):
+        """The stored README of `repo_name` as a dict (repo_name, repo_desc, star, pushed_at, page_content), or None."""
+        with self._lock:
+            row = self._pending.get(repo_name)
+            if row is not None:
+                name, _, content, desc, star, pushed_at, _ = row
+                return {'repo_name': name, 'repo_desc': desc, 'star': star, 'pushed_at': pushed_at, 'page_content': content}
+            found = self._conn.execute(
+                'SELECT r.repo_desc, r.star, r.pushed_at, c.content FROM readmes r JOIN contents c ON c.hash = r.hash '
+                'WHERE r.repo_name = ?', (repo_name,)
+            ).fetchone()
+        if found is None:
+            return None
+        desc, star, pushed_at, content = found
+        return {'repo_name': repo_name, 'repo_desc': desc, 'star': star, 'pushed_at': pushed_at,
+                'page_content': zlib.decompress(content).decode('utf-8')}
+
+    def __contains__(self, repo_name):
+        with self._lock:
+            if repo_name in self._pending:
+                return True
+            return self._conn.execute('SELECT 1 FROM readmes WHERE repo_name = ?', (repo_name,)).fetchone() is not None
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM readmes').fetchone()[0]
+
+    def iter_documents(self, repo_names=None, batch=1000):
+        """Yield every stored README (or those of `repo_names`) as a Document, reading `batch` rows at a time."""
+        self.flush()
+        # own connection: the scan must not hold the lock that get() and put() need
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            query = ('SELECT r.repo_name, r.repo_desc, r.star, c.content FROM readmes r '
+                     'JOIN contents c ON c.hash = r.hash')
+            if repo_names is None:
+                cursors = [conn.execute(query + ' ORDER BY r.repo_name')]
+            else:
+                names = list(repo_names)
+                cursors = (
+                    conn.execute(query + f' WHERE r.repo_name IN ({",".join("?" * len(part))})', part)
+                    for part in (names[i:i + 500] for i in range(0, len(names), 500))
+                )
+            for cursor in cursors:
+                while True:
+                    rows = cursor.fetchmany(batch)
+                    if not rows:
+                        break
+                    for name, desc, star, content in rows:
+                        yield Document(
+                            page_content=zlib.decompress(content).decode('utf-8'),
+                            metadata={'repo_name': name, 'repo_desc': desc, 'star': star},
+                        )
+        finally:
+            conn.close()
+
+    def vacuum(self):
+        """Drop contents no repo points to any more (READMEs replaced by newer versions)."""
+        self.flush()
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM contents WHERE hash NOT IN (SELECT hash FROM readmes)').rowcount
+            self._conn.commit()
+        return removed
+
+    def import_jsonl(self, path):
+        """Load an old append-only `readme.json` (one JSON object per line); duplicates collapse on upsert."""
+        count = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                self.put(item['repo_name'], item['page_content'], item.get('repo_desc'), item.get('star'))
+                count += 1
+        self.flush()
+        return count
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_stop)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    def stats(self):
+        with self._lock:
+            repos, contents = self._conn.execute(
+                'SELECT (SELECT COUNT(*) FROM readmes), (SELECT COUNT(*) FROM contents)'
+            ).fetchone()
+        return {
+            'repos': repos,
+            'contents': contents,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'bytes': os.path.getsize(self.path),
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_store():
+    """The process-wide README store; queued puts are committed at exit."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ReadmeStore()
+            atexit.register(_default.close)
+        return _default
+
+
+if __name__ == '__main__':
+    # python readme_store.py [readme.json]: migrate the old append-only file and print the store's size
+    store = default_store()
+    if len(sys.argv) > 1:
+        print(f"Imported {store.import_jsonl(sys.argv[1])} lines from {sys.argv[1]}")
+    print(store.stats())
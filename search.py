@@ -1,45 +1,105 @@
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
 import time
+import asyncio
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import openai
 from dotenv import load_dotenv
 load_dotenv()
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from github import Github
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+import faiss
+import numpy as np
 from tenacity import (
     retry,
     retry_if_exception_type,
     wait_random_exponential,
 )  # for exponential backoff
 import json
+from gh_async import AsyncGithub, api_url
+from ratelimit import budget, resource_for
+from http_cache import default_cache, request_key
+from store import lexical_index, index_positions, open_store, raw_rows
+from lexical import top_k
+from langchain_core.documents import Document
+import ann
+import telemetry
 gh_token = os.getenv('GH_TOKEN')
-g = Github(gh_token)
+g = Github(gh_token, per_page=100, base_url=api_url)
+# the search API returns at most 1000 results per query: every page there is
+max_pages = 10
 
-def make_request(url, params=None):
-    """Make a request with rate limit handling."""
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=50))
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=50))
+
+def _cached_response(entry, url):
+    """A `requests.Response` serving `entry` from the HTTP cache."""
+    response = requests.Response()
+    response.status_code = entry.status
+    response.headers.update(entry.headers)
+    response._content = entry.body
+    response.url = url
+    response.from_cache = True
+    return response
+
+def make_request(url, params=None, retries=5, accept='application/json', pushed_at=None):
+    """Make a request with rate limit handling.
+
+    GET responses go through the HTTP cache (see http_cache): a cached body is
+    returned without a request if the staleness policy allows it for the
+    repo's `pushed_at`, otherwise the request is made conditional and a 304
+    is answered from the cache.
+    """
     headers = {
-            'Authorization': gh_token,
             'Content-Type':'application/json',
-            'Accept':'application/json',
+            'Accept': accept,
             'User-Agent': 'Mozilla/5.0'
         }
-    while True:
-        try:
-            response = requests.get(url, headers=headers, params=params, verify=False, timeout=10, proxies={})
-            if response.status_code == 403 and 'X-RateLimit-Remaining' in response.headers and response.headers['X-RateLimit-Remaining'] == '0':
-                # We hit the rate limit, wait and try again
-                reset_time = int(response.headers['X-RateLimit-Reset'])
-                sleep_time = max(reset_time - time.time(), 0)
-                print(f"Rate limit hit. Sleeping for {sleep_time} seconds.")
-                time.sleep(sleep_time + 1)  # Adding 1 second just to be safe
-            else:
-                return response
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            time.sleep(5)  # Wait for some time before retrying
+    if gh_token:
+        headers['Authorization'] = f'token {gh_token}'
+    cache = default_cache()
+    key = entry = None
+    if cache is not None:
+        key = request_key(url, params, accept)
+        entry = cache.get(key)
+        if entry is not None:
+            if cache.is_fresh(entry, pushed_at):
+                return _cached_response(cache.hit(entry), url)
+            headers.update(entry.validators())
+    with telemetry.span('github.request', url=url, resource=resource_for(url)) as span:
+        for attempt in range(retries + 1):
+            span.set(attempts=attempt + 1)
+            try:
+                budget.acquire(resource_for(url))
+                response = session.get(url, headers=headers, params=params, timeout=10)
+                budget.update_from_headers(response.headers, resource_for(url))
+                span.set(status=response.status_code, bytes=len(response.content))
+                if response.status_code == 403 and 'X-RateLimit-Remaining' in response.headers and response.headers['X-RateLimit-Remaining'] == '0':
+                    # We hit the rate limit, wait and try again
+                    reset_time = int(response.headers['X-RateLimit-Reset'])
+                    sleep_time = max(reset_time - time.time(), 0)
+                    print(f"Rate limit hit. Sleeping for {sleep_time} seconds.")
+                    span.add('sleep_seconds', sleep_time + 1)
+                    time.sleep(sleep_time + 1)  # Adding 1 second just to be safe
+                else:
+                    if cache is not None:
+                        cached = cache.update(key, url, entry, response.status_code, response.headers, response.content)
+                        if cached is not None:
+                            return _cached_response(cached, url)
+                    return response
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                if attempt == retries:
+                    raise
+                backoff = random.uniform(0, min(60, 2 ** attempt))
+                span.add('sleep_seconds', backoff)
+                time.sleep(backoff)  # jittered backoff before retrying
+    raise RuntimeError(f"Rate limit still exhausted after {retries + 1} attempts: {url}")
 
 def save_json(data, file_path):
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -52,7 +112,9 @@ def check_readme(repo, least_star=0):
     while True:
         cnt = 0
         try:
+            budget.acquire('core')
             contents = repo.get_contents("")
+            budget.update_from_github(repo, 'core')
             star_count = repo.stargazers_count
             break
         except Exception as e:
@@ -85,53 +147,300 @@ def check_readme(repo, least_star=0):
     return all((contains_source, contains_readme, star_satify))
 
 
-def search_github(keywords: list, pages):
-    cnt = 0
-    if isinstance(keywords, str):
-        keywords = [keywords]
+class _KeywordMerge:
+    """Merges the result pages of several keywords into one stream of repos not seen before.
 
-    repos = []
-    repos_set = set()
-    for keyword in keywords:
-        meta_json = []
-        repositories = g.search_repositories(query=keyword,sort='stars',order='desc')
-        print(f'Totle repo: {repositories.totalCount}')
-        for repo in repositories:
-            rate_limit = g.get_rate_limit().core
-            if rate_limit.remaining == 0:
-                wait_time = rate_limit.reset.timestamp() - time.time()
-                print(f"Rate limit exceeded, sleeping for {wait_time} seconds")
-                time.sleep(wait_time+1)
-            repo_name = repo.full_name
-            if repo_name in repos_set:
+    When a keyword is done its new repos are saved under ./1105_test and, if
+    `by_keyword` is a dict, keyword -> names of every repo it returned
+    (including ones another keyword found first) is recorded there.
+    """
+
+    def __init__(self, by_keyword=None):
+        self.by_keyword = by_keyword
+        self.seen = set()
+        self.names = {}
+        self.meta_json = {}
+
+    def page(self, keyword, page_repos):
+        new_repos = []
+        for repo in page_repos:
+            self.names.setdefault(keyword, []).append(repo.full_name)
+            if repo.full_name in self.seen:
                 continue
-            else:
-                repos_set.add(repo_name)
-            # if not check_readme(repo):
-            #     continue
-            meta_data = {
+            self.seen.add(repo.full_name)
+            new_repos.append(repo)
+            self.meta_json.setdefault(keyword, []).append({
                 'repo_name' : repo.full_name,
                 'repo_desc' : repo.description,
                 'star': repo.stargazers_count,
-            }
-            repos.append(repo)
-            cnt += 1
-            meta_json.append(meta_data)
-            print(f'{cnt}:  {repo.full_name}')
-        save_json(meta_json, f'./1105_test/{keyword}.json')
-        time.sleep(10)
-    print(f'Total {cnt} valid repos!')
-    return repos
+            })
+            print(f'{len(self.seen)}:  {repo.full_name}')
+        return new_repos
+
+    def done(self, keyword):
+        save_json(self.meta_json.get(keyword, []), f'./1105_test/{keyword}.json')
+        if self.by_keyword is not None:
+            self.by_keyword[keyword] = self.names.get(keyword, [])
+
+
+def _search_pages(keyword, pages, out, stop):
+    """Put up to `pages` result pages of `keyword` on `out` as (keyword, repos), then (keyword, None)."""
+    try:
+        repositories = g.search_repositories(query=keyword,sort='stars',order='desc')
+        for page in range(pages):
+            if stop.is_set():
+                break
+            with telemetry.span('github.search_page', keyword=keyword, page=page) as span:
+                budget.acquire('search')
+                page_repos = repositories.get_page(page)
+                budget.update_from_github(g, 'search')
+                span.set(repos=len(page_repos))
+            if page == 0:
+                print(f'Totle repo: {repositories.totalCount}')
+            out.put((keyword, page_repos))
+            # the search API serves at most 1000 results
+            if len(page_repos) < g.per_page or (page + 1) * g.per_page >= min(repositories.totalCount, 1000):
+                break
+    except Exception as e:
+        out.put((keyword, e))
+        return
+    out.put((keyword, None))
+
+
+def iter_github(keywords: list, pages, by_keyword=None, workers=4):
+    """Search the keywords concurrently and yield every new repo as soon as its result page arrives.
+
+    At most `pages` pages of `g.per_page` repos are fetched per keyword, on
+    up to `workers` threads. Passing the generator to `download.load_readme`
+    starts fetching READMEs with the first page instead of after the last.
+    `by_keyword` is filled as in `search_github` once a keyword is done.
+    """
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    merge = _KeywordMerge(by_keyword)
+    out = queue.Queue()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(min(workers, len(keywords)), 1))
+    for keyword in keywords:
+        # each page search runs in a copy of the caller's context, so its spans join the caller's trace
+        executor.submit(contextvars.copy_context().run, _search_pages, keyword, pages, out, stop)
+    try:
+        running = len(keywords)
+        while running:
+            keyword, page_repos = out.get()
+            if isinstance(page_repos, Exception):
+                raise page_repos
+            if page_repos is None:
+                running -= 1
+                merge.done(keyword)
+                continue
+            yield from merge.page(keyword, page_repos)
+    finally:
+        # the consumer may stop early; searches not started yet are dropped
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    print(f'Total {len(merge.seen)} valid repos!')
+
+
+def search_github(keywords: list, pages, by_keyword=None, workers=4):
+    """Search each keyword (at most `pages` result pages each) and return the deduplicated repos.
+
+    If `by_keyword` is a dict it is filled with keyword -> names of every repo
+    that keyword returned, including ones an earlier keyword already found.
+    """
+    return list(iter_github(keywords, pages, by_keyword=by_keyword, workers=workers))
+
+async def iter_github_async(keywords: list, pages, per_page=100, client: AsyncGithub = None, by_keyword=None):
+    """Async `iter_github`: all keywords are searched concurrently over one pooled session.
+
+    Yields `RepoInfo` tuples as their pages arrive; `download.load_readme(...,
+    use_async=True)` accepts the generator and starts fetching right away.
+    """
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    if client is None:
+        async with AsyncGithub() as client:
+            async for repo in iter_github_async(keywords, pages, per_page, client, by_keyword):
+                yield repo
+        return
+
+    merge = _KeywordMerge(by_keyword)
+    out = asyncio.Queue()
+
+    async def produce(keyword):
+        try:
+            async for page_repos in client.iter_repositories(keyword, max_results=pages * per_page, per_page=per_page):
+                await out.put((keyword, page_repos))
+        except Exception as e:
+            await out.put((keyword, e))
+            return
+        await out.put((keyword, None))
+
+    tasks = [asyncio.create_task(produce(keyword)) for keyword in keywords]
+    try:
+        running = len(keywords)
+        while running:
+            keyword, page_repos = await out.get()
+            if isinstance(page_repos, Exception):
+                raise page_repos
+            if page_repos is None:
+                running -= 1
+                merge.done(keyword)
+                continue
+            for repo in merge.page(keyword, page_repos):
+                yield repo
+    finally:
+        for task in tasks:
+            task.cancel()
+    print(f'Total {len(merge.seen)} valid repos!')
+
+async def search_github_async(keywords: list, pages, per_page=100, client: AsyncGithub = None, by_keyword=None):
+    """Like `search_github`, but all keywords are searched concurrently over one pooled session.
+
+    Returns `RepoInfo` tuples, which `download.load_readme`/`load_vector_db` accept for README
+    ingestion; they are not PyGithub repos (`check_readme` needs those).
+    """
+    return [repo async for repo in iter_github_async(keywords, pages, per_page, client, by_keyword)]
+
+def _min_max(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    span = high - low
+    return {key: (value - low) / span if span else 1.0 for key, value in scores.items()}
 
 @retry(wait=wait_random_exponential(min=1, max=60), retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)))
-def search_db(db, query):
-    bm25_retriever = BM25Retriever.from_documents(db.docstore._dict.values())
-    faiss_retriever = db.as_retriever()
-    ensemble_retriever = EnsembleRetriever(
-        retrievers=[bm25_retriever, faiss_retriever], weights=[0.6, 0.4]
-    )
-    similar_repo = ensemble_retriever.invoke(query)
-    return similar_repo
+def hybrid_search(db, queries, k=5, weights=(0.6, 0.4), fusion='weighted', fetch_k=None, rrf_c=60, allowed_ids=None,
+                  nprobe=None, ef_search=None):
+    """Fused BM25 + dense search for one query or a list of queries.
+
+    All queries are embedded in one request and searched with one FAISS call;
+    BM25 scores come from one sparse product. `weights` is (lexical, dense).
+    `fusion='weighted'` min-max normalizes both score lists per query and adds
+    them, `fusion='rrf'` uses weighted reciprocal rank fusion like
+    `EnsembleRetriever`. `db` is a FAISS store or the path of one, opened
+    through the shared store cache. `allowed_ids` restricts both sides to a set of
+    docstore ids (a keyword view of the shared corpus); on an HNSW or IVF
+    index a view of up to `ann.exact_view_rows` docs is searched exactly over
+    its raw vectors, a larger one with efSearch/nprobe scaled to its size. `nprobe` (IVF) and
+    `ef_search` (HNSW) trade recall for speed on this call only. Returns a list of
+    (Document, score) per query, best first, or a single list when `queries`
+    is a string.
+    """
+    if isinstance(db, str):
+        db = open_store(db)
+    single = isinstance(queries, str)
+    if single:
+        queries = [queries]
+    fetch_k = fetch_k or max(4 * k, 20)
+    lexical_weight, dense_weight = weights
+
+    vectors = np.asarray(db.embeddings.embed_documents(queries), dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(vectors)
+    with telemetry.span('search.dense', queries=len(queries), ntotal=db.index.ntotal, index=ann.index_kind(db.index),
+                        filtered=allowed_ids is not None) as span:
+        positions = rows = None
+        if allowed_ids is not None:
+            positions = index_positions(db, allowed_ids)
+            if ann.index_kind(db.index) != 'flat' and len(positions) <= ann.exact_view_rows:
+                try:
+                    rows = raw_rows(db, positions)
+                except ValueError:
+                    # quantized store without its raw vectors: filter the index search instead
+                    rows = None
+        span.set(exact=rows is not None)
+        if rows is not None:
+            # a small view of an approximate index: exact search over the view's own vectors
+            if db._normalize_L2:
+                faiss.normalize_L2(rows)
+            distances, local = ann.search_rows(vectors, rows, db.index.metric_type, fetch_k)
+            indices = positions[local]
+        else:
+            selector = None
+            if positions is not None:
+                # the selector must outlive the search call, keep it referenced
+                selector = faiss.IDSelectorBatch(positions)
+            params = ann.search_parameters(db.index, selector, nprobe=nprobe, ef_search=ef_search,
+                                           selectivity=len(positions) / max(db.index.ntotal, 1) if positions is not None else None)
+            search_kwargs = {'params': params} if params is not None else {}
+            distances, indices = db.index.search(vectors, min(fetch_k, max(db.index.ntotal, 1)), **search_kwargs)
+    # FAISS returns distances for L2 and similarities for inner product; turn both into "higher is better"
+    sign = 1.0 if db.index.metric_type == faiss.METRIC_INNER_PRODUCT else -1.0
+
+    with telemetry.span('search.lexical', queries=len(queries)):
+        lexical = lexical_index(db)
+        lexical_scores = lexical.score_batch(queries)
+        if allowed_ids is not None:
+            mask = np.zeros(lexical_scores.shape[1], dtype=bool)
+            rows = [lexical.positions[doc_id] for doc_id in allowed_ids if doc_id in lexical.positions]
+            mask[[row for row in rows if row < len(mask)]] = True
+            lexical_scores[:, ~mask] = 0
+
+    results = []
+    for qi in range(len(queries)):
+        dense = {}
+        for distance, i in zip(distances[qi], indices[qi]):
+            if i != -1:
+                dense[db.index_to_docstore_id[i]] = sign * float(distance)
+        row = lexical_scores[qi]
+        sparse_hits = {lexical.ids[i]: float(row[i]) for i in top_k(row, fetch_k)}
+        if fusion == 'rrf':
+            fused = {}
+            for ranked, weight in ((sparse_hits, lexical_weight), (dense, dense_weight)):
+                for rank, doc_id in enumerate(sorted(ranked, key=ranked.get, reverse=True)):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + weight / (rrf_c + rank + 1)
+        else:
+            # candidates found by only one side still get their real lexical score
+            for doc_id in dense:
+                if doc_id not in sparse_hits and doc_id in lexical.positions:
+                    sparse_hits[doc_id] = float(row[lexical.positions[doc_id]])
+            sparse_norm, dense_norm = _min_max(sparse_hits), _min_max(dense)
+            fused = {
+                doc_id: lexical_weight * sparse_norm.get(doc_id, 0.0) + dense_weight * dense_norm.get(doc_id, 0.0)
+                for doc_id in set(sparse_hits) | set(dense)
+            }
+        top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        results.append([(db.docstore.search(doc_id), score) for doc_id, score in top])
+    return results[0] if single else results
+
+def aggregate_hits(hits, k=5, how='max'):
+    """Group chunk hits by `repo_name` into one (Document, score) per repo, best first.
+
+    A repo scores the max (or `how='sum'`) of its chunk scores; its Document
+    holds the hit chunks in README order and lists them in `metadata['chunks']`.
+    Documents without a `chunk` number (whole READMEs) pass through as they are.
+    """
+    repos = {}
+    for doc, score in hits:
+        repos.setdefault(doc.metadata.get('repo_name'), []).append((doc, score))
+    results = []
+    for repo_hits in repos.values():
+        scores = [score for _, score in repo_hits]
+        score = sum(scores) if how == 'sum' else max(scores)
+        docs = sorted((doc for doc, _ in repo_hits), key=lambda doc: doc.metadata.get('chunk', 0))
+        if len(docs) == 1:
+            doc = docs[0]
+        else:
+            metadata = {key: value for key, value in docs[0].metadata.items() if key != 'chunk'}
+            metadata['chunks'] = [doc.metadata.get('chunk') for doc in docs]
+            doc = Document(page_content='\n...\n'.join(doc.page_content for doc in docs), metadata=metadata)
+        results.append((doc, score))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:k]
+
+def search_db(db, query, k=5, weights=(0.6, 0.4), fusion='rrf', allowed_ids=None, aggregate='max', chunks_per_repo=4,
+              with_scores=False, **kwargs):
+    """The `k` best repos for `query`; chunk hits are merged per repo with `aggregate` ('max', 'sum' or None).
+
+    Returns Documents, or (Document, fused score) pairs `with_scores`.
+    """
+    if aggregate is None:
+        hits = hybrid_search(db, query, k=k, weights=weights, fusion=fusion, allowed_ids=allowed_ids, **kwargs)
+    else:
+        hits = hybrid_search(db, query, k=k * chunks_per_repo, weights=weights, fusion=fusion, allowed_ids=allowed_ids, **kwargs)
+        hits = aggregate_hits(hits, k=k, how=aggregate)
+    return hits if with_scores else [doc for doc, _ in hits]
 
 if __name__ == '__main__':
     search_github('diff-gaussian', 2)
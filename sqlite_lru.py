@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+
+def connect(path, *schema):
+    """A thread-shareable WAL connection to the SQLite file at `path`, with the `schema` statements applied."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+class LruTable:
+    """A SQLite table used as a size-bounded cache, evicted least-recently-used by its `last_used` column.
+
+    The row count is tracked without a COUNT(*) per write: an upsert only
+    counts the keys it adds, not the rows it replaces. Once `max_entries` is
+    exceeded, rows are evicted down to 90% so we don't pay a DELETE on every
+    insert. Not locked itself: callers hold their own lock around every call
+    and commit.
+    """
+
+    def __init__(self, conn, table, key_columns, max_entries):
+        self.conn = conn
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.max_entries = max_entries
+        self.size = self.count()
+
+    def count(self):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def existing(self, keys):
+        """How many of the key tuples in `keys` are already stored."""
+        found = 0
+        width = len(self.key_columns)
+        # stay under SQLite's default limit of 999 variables per statement
+        step = max(900 // width, 1)
+        for i in range(0, len(keys), step):
+            part = keys[i:i + step]
+            values = ', '.join(['(' + ', '.join('?' * width) + ')'] * len(part))
+            found += self.conn.execute(
+                f'SELECT COUNT(*) FROM {self.table} WHERE ({", ".join(self.key_columns)}) IN (VALUES {values})',
+                [value for key in part for value in key],
+            ).fetchone()[0]
+        return found
+
+    def upsert(self, columns, rows, expired=None):
+        """INSERT OR REPLACE `rows` (tuples in `columns` order), then evict if the table grew too big."""
+        positions = [columns.index(column) for column in self.key_columns]
+        keys = list({tuple(row[i] for i in positions) for row in rows})
+        added = len(keys) - self.existing(keys)
+        self.conn.executemany(
+            f'INSERT OR REPLACE INTO {self.table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+            rows,
+        )
+        self.size += added
+        self.evict(expired)
+
+    def evict(self, expired=None):
+        """Evict down to 90% of `max_entries` once it is exceeded.
+
+        `expired` is an optional (condition, params) selecting rows that are
+        dropped first, before any least-recently-used one.
+        """
+        if self.size <= self.max_entries:
+            return
+        if expired is not None:
+            condition, params = expired
+            self.conn.execute(f'DELETE FROM {self.table} WHERE {condition}', params)
+            self.size = self.count()
+            if self.size <= self.max_entries:
+                return
+        self.conn.execute(
+            f'DELETE FROM {self.table} WHERE rowid IN (SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)',
+            (self.size - int(self.max_entries * 0.9),),
+        )
+        self.size = self.count()
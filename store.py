@@ -0,0 +1,268 @@
+import contextlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+import ann
+from embedding_cache import default_embeddings
+from lexical import LexicalIndex, index_file
+from mmap_store import MmapDocstore, is_mmap_store, read_store, write_store, meta_file
+
+_lock = threading.Lock()
+# lexical index and on-disk path of every store opened or saved through this module
+_lexical = weakref.WeakKeyDictionary()
+_paths = weakref.WeakKeyDictionary()
+# docstore id -> FAISS position, rebuilt when the store grows
+_positions = weakref.WeakKeyDictionary()
+# raw float32 embeddings of each store as a list of row chunks (memmap first, then added batches)
+_raw = weakref.WeakKeyDictionary()
+# stores whose FAISS index is memory-mapped and must not be added to
+_readonly = weakref.WeakSet()
+
+
+def load_store(path, embeddings, writable=False):
+    """Open the store under `path`.
+
+    Stores in the mmap format (see mmap_store) open without unpickling or
+    copying the index; with `writable` the index is read into RAM so
+    documents can be added. Older pickled stores are loaded with
+    `FAISS.load_local` and converted on their next save.
+    """
+    if is_mmap_store(path):
+        index, docstore, index_to_docstore_id, vectors = read_store(path, writable=writable)
+        db = FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+        with _lock:
+            _raw[db] = [vectors]
+            if not writable:
+                _readonly.add(db)
+    else:
+        db = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    with _lock:
+        _paths[db] = path
+    return db
+
+
+def raw_vectors(db: FAISS):
+    """Row chunks that stack to the (ntotal, d) raw embeddings of `db`."""
+    with _lock:
+        chunks = _raw.get(db)
+        if chunks is None or sum(len(chunk) for chunk in chunks) != db.index.ntotal:
+            # store we have not tracked (pickled or built elsewhere): read the vectors back out of the index,
+            # which is only exact for indexes that keep full vectors
+            if db.index.ntotal and ann.index_kind(db.index) not in ('flat', 'hnsw'):
+                raise ValueError(
+                    f"raw embeddings of this {ann.index_kind(db.index)} store are not available and its index "
+                    "only keeps quantized or unrecoverable vectors; re-embed its documents into a new store"
+                )
+            chunks = [db.index.reconstruct_n(0, db.index.ntotal)] if db.index.ntotal else []
+            _raw[db] = chunks
+        return list(chunks)
+
+
+def raw_rows(db: FAISS, positions):
+    """Raw embeddings of the FAISS positions in `positions` (sorted ascending), as one (len, d) array."""
+    out = np.empty((len(positions), db.index.d), dtype=np.float32)
+    offset = filled = 0
+    for chunk in raw_vectors(db):
+        lo, hi = np.searchsorted(positions, [offset, offset + len(chunk)])
+        out[filled:filled + hi - lo] = chunk[positions[lo:hi] - offset]
+        filled += hi - lo
+        offset += len(chunk)
+    return out
+
+
+def save_store(db: FAISS, path):
+    """Save the FAISS index, documents, raw embeddings and BM25 index under `path`."""
+    write_store(db, path, raw_vectors(db))
+    lexical_index(db).save(path)
+    with _lock:
+        _paths[db] = path
+    store_cache.put(path, db)
+
+
+def lexical_index(db: FAISS) -> LexicalIndex:
+    """BM25 index of `db`: loaded from disk on first use, or built once from the docstore."""
+    with _lock:
+        index = _lexical.get(db)
+        if index is not None:
+            return index
+        path = _paths.get(db)
+        if path and os.path.exists(os.path.join(path, index_file)):
+            index = LexicalIndex.load(path)
+        else:
+            index = LexicalIndex.from_docstore(db)
+            if path:
+                index.save(path)
+        _lexical[db] = index
+        return index
+
+
+def add_documents(db: FAISS, docs, lock=None, vectors=None):
+    """Add `docs` to the vector store and its BM25 index.
+
+    With `lock`, only the change to the store is made holding it: the
+    embedding request runs before, so searches under the same lock are not
+    held up by the network. `vectors` are the docs' embeddings when the
+    caller already has them.
+    """
+    if db in _readonly:
+        raise ValueError("store is memory-mapped read-only, open it with load_store(..., writable=True) to add documents")
+    if vectors is None:
+        vectors = db.embeddings.embed_documents([doc.page_content for doc in docs])
+    with lock or contextlib.nullcontext():
+        # resolve both first so lazy builds from the docstore/index don't pick up `docs` twice
+        index = lexical_index(db)
+        raw_vectors(db)
+        ids = db.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in zip(docs, vectors)],
+            metadatas=[doc.metadata for doc in docs],
+        )
+        with _lock:
+            _raw[db].append(np.asarray(vectors, dtype=np.float32))
+        index.add_documents(docs, ids)
+    return ids
+
+
+def index_positions(db: FAISS, doc_ids):
+    """FAISS index positions of the docstore ids in `doc_ids` (unknown ids are skipped)."""
+    with _lock:
+        positions = _positions.get(db)
+        if positions is None or len(positions) != len(db.index_to_docstore_id):
+            positions = {doc_id: i for i, doc_id in db.index_to_docstore_id.items()}
+            _positions[db] = positions
+    return np.asarray(sorted(positions[doc_id] for doc_id in doc_ids if doc_id in positions), dtype=np.int64)
+
+
+def merge_stores(paths, out_path, embeddings):
+    """Combine the stores at `paths` into one at `out_path`, keeping one copy of each repo.
+
+    Vectors are copied out of the source indexes, nothing is re-embedded.
+    Empty sources are skipped; raises ValueError if there is nothing to merge.
+    """
+    texts, vectors, metadatas = [], [], []
+    seen = set()
+    for path in paths:
+        db = open_store(path, embeddings)
+        if not db.index.ntotal:
+            continue
+        source_vectors = np.concatenate(raw_vectors(db))
+        for i, doc_id in db.index_to_docstore_id.items():
+            doc = db.docstore.search(doc_id)
+            key = (doc.metadata.get('repo_name'), doc.page_content)
+            if key in seen:
+                continue
+            seen.add(key)
+            texts.append(doc.page_content)
+            vectors.append(source_vectors[i])
+            metadatas.append(doc.metadata)
+    if not texts:
+        raise ValueError(f"no documents to merge into {out_path}: the {len(paths)} source stores are empty")
+    merged = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+    with _lock:
+        _raw[merged] = [np.asarray(vectors, dtype=np.float32)]
+    ann.maybe_rebuild(merged)
+    save_store(merged, out_path)
+    return merged
+
+
+store_files = (meta_file, 'index.faiss', 'index.pkl', index_file)
+
+
+def _signature(path):
+    try:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(path) if entry.name in store_files
+        ))
+    except FileNotFoundError:
+        return None
+
+
+def _estimate_bytes(db: FAISS):
+    if db in _readonly:
+        # mapped index and documents live in the shared page cache, not in this process
+        index_bytes = 0
+    else:
+        index_bytes = ann.estimated_bytes(db.index)
+    if isinstance(db.docstore, MmapDocstore):
+        docs = db.docstore.overlay.values()
+    else:
+        docs = db.docstore._dict.values()
+    doc_bytes = sum(len(doc.page_content) + 200 for doc in docs)
+    lexical = _lexical.get(db)
+    lexical_bytes = len(lexical._rows) * 12 + len(lexical) * 60 if lexical is not None else 0
+    return index_bytes + doc_bytes + lexical_bytes
+
+
+class StoreCache:
+    """LRU of opened stores (FAISS index, docstore and BM25 index), bounded by estimated resident bytes.
+
+    An entry is reloaded when the files under its path change on disk.
+    """
+
+    def __init__(self, max_bytes=int(os.getenv('RAGC_STORE_CACHE_BYTES', 2 * 1024 ** 3)), max_stores=32):
+        self.max_bytes = max_bytes
+        self.max_stores = max_stores
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, embeddings=None):
+        key = os.path.abspath(path)
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['signature'] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['db']
+            self.misses += 1
+        db = load_store(path, embeddings or default_embeddings())
+        lexical_index(db)
+        self.put(path, db, signature)
+        return db
+
+    def put(self, path, db, signature=None):
+        key = os.path.abspath(path)
+        entry = {'db': db, 'signature': signature or _signature(path), 'bytes': _estimate_bytes(db)}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_stores or self.resident_bytes() > self.max_bytes
+            ):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(os.path.abspath(path), None)
+
+    def resident_bytes(self):
+        return sum(entry['bytes'] for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'stores': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'resident_bytes': self.resident_bytes(),
+            }
+
+
+store_cache = StoreCache()
+
+
+def open_store(path, embeddings=None):
+    """Store at `path`, served from the in-process LRU when its files are unchanged."""
+    return store_cache.get(path, embeddings)
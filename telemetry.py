@@ -0,0 +1,195 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+
+# RAGC_TRACE=<file>.jsonl writes spans and counters there, RAGC_TRACE=otel hands
+# spans to the OpenTelemetry tracer provider configured for the process
+trace_target = os.getenv('RAGC_TRACE', '')
+
+
+class _NoopSpan:
+    """What `span` returns while tracing is off: every call is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+
+_noop = _NoopSpan()
+_current = contextvars.ContextVar('ragc_span', default=None)
+
+
+class Span:
+    """One timed operation; attributes are OTel-style key/values (tokens, bytes, retries, sleep time, ...)."""
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(8).hex()
+        self.error = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = repr(exc)
+        self.tracer.export(self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, value=1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def record(self):
+        # field names follow the OTLP JSON span encoding
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start,
+            'endTimeUnixNano': self.end,
+            'durationMs': (self.end - self.start) / 1e6,
+            'attributes': self.attrs,
+            'status': {'code': 'ERROR', 'message': self.error} if self.error else {'code': 'OK'},
+        }
+
+
+class JsonlTracer:
+    """Appends one JSON line per finished span, and the counter totals at exit."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', buffering=1)
+        self._lock = threading.Lock()
+        self.counters = {}
+        atexit.register(self.close)
+
+    def span(self, name, attrs):
+        return Span(self, name, attrs)
+
+    def export(self, span):
+        line = json.dumps(span.record(), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            for name, value in self.counters.items():
+                self._file.write(json.dumps({'name': name, 'type': 'counter', 'value': value, 'timeUnixNano': time.time_ns()}) + '\n')
+            self._file.close()
+
+
+class _OtelSpan:
+    def __init__(self, context, attrs):
+        self._context = context
+        self._attrs = attrs
+        self._sums = {}
+        self._span = None
+
+    def __enter__(self):
+        self._span = self._context.__enter__()
+        self.set(**self._attrs)
+        return self
+
+    def __exit__(self, *exc):
+        return self._context.__exit__(*exc)
+
+    def set(self, **attrs):
+        for key, value in attrs.items():
+            self._span.set_attribute(key, value if isinstance(value, (bool, int, float, str)) else str(value))
+
+    def add(self, key, value=1):
+        # OTel spans cannot read attributes back, keep the running sums here
+        self._sums[key] = self._sums.get(key, 0) + value
+        self._span.set_attribute(key, self._sums[key])
+
+
+class OtelTracer:
+    """Forwards spans and counters to the `opentelemetry` API (exporters come from its SDK setup)."""
+
+    def __init__(self):
+        from opentelemetry import metrics, trace
+        self._tracer = trace.get_tracer('ragc')
+        self._meter = metrics.get_meter('ragc')
+        self._instruments = {}
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def span(self, name, attrs):
+        return _OtelSpan(self._tracer.start_as_current_span(name), attrs)
+
+    def count(self, name, value):
+        with self._lock:
+            counter = self._instruments.get(name)
+            if counter is None:
+                counter = self._instruments[name] = self._meter.create_counter(name)
+            self.counters[name] = self.counters.get(name, 0) + value
+        counter.add(value)
+
+
+def _make_tracer(target):
+    if not target:
+        return None
+    if target == 'otel':
+        try:
+            return OtelTracer()
+        except ImportError:
+            print("RAGC_TRACE=otel but opentelemetry is not installed, tracing is off")
+            return None
+    return JsonlTracer(target)
+
+
+tracer = _make_tracer(trace_target)
+
+
+def configure(target):
+    """Switch tracing to `target` (a JSONL path, 'otel', or '' / None to turn it off)."""
+    global tracer
+    if isinstance(tracer, JsonlTracer):
+        tracer.close()
+    tracer = _make_tracer(target)
+
+
+def span(name, **attrs):
+    """Context manager timing `name`; returns a shared no-op object when tracing is off."""
+    if tracer is None:
+        return _noop
+    return tracer.span(name, attrs)
+
+
+def count(name, value=1):
+    if tracer is not None:
+        tracer.count(name, value)
+
+
+def counters():
+    return dict(tracer.counters) if tracer is not None else {}
@@ -0,0 +1,49 @@
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import ann
+import store
+from cascade import ReviewCascade
+from mmap_store import MmapDocstore
+from search import search_db
+
+
+class TableEmbeddings(Embeddings):
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def test_dense_only_hit_survives_default_cascade():
+    query = 'gaussian splatting renderer'
+    both = 'gaussian splatting renderer in python'
+    # shares no term with the query, only its embedding is close
+    dense_only = 'differentiable rasterizer for radiance fields in python'
+    unrelated = 'web server framework in python'
+    vectors = {
+        query: [1.0, 0.0, 0.0],
+        both: [0.99, 0.1, 0.0],
+        dense_only: [0.98, 0.2, 0.0],
+        unrelated: [0.0, 0.0, 1.0],
+    }
+    db = FAISS(embedding_function=TableEmbeddings({k: np.asarray(v, dtype=np.float32) for k, v in vectors.items()}),
+               index=ann.new_index(3), docstore=MmapDocstore(), index_to_docstore_id={})
+    store.add_documents(db, [
+        Document(page_content=text, metadata={'repo_name': f'repo/{i}'})
+        for i, text in enumerate([both, dense_only, unrelated])
+    ])
+
+    hits = search_db(db, query, k=3, fusion='rrf', aggregate=None, with_scores=True)
+    scores = {doc.page_content: score for doc, score in hits}
+    # the RRF gap a ratio test used to reject on
+    assert scores[dense_only] < 0.6 * scores[both]
+
+    passed, skipped = ReviewCascade().apply('A gaussian splatting renderer written in Python.', hits)
+    assert dense_only in [doc.page_content for doc in passed]
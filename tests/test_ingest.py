@@ -0,0 +1,30 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import ann
+from embedding_cache import CachedEmbeddings
+from ingest import BatchIndexer, count_tokens
+from mmap_store import MmapDocstore
+from test_store import HashEmbeddings
+
+
+def index(db, docs):
+    indexer = BatchIndexer(db, linger=0)
+    for doc in docs:
+        indexer.put(doc)
+    return indexer.close()
+
+
+def test_tokens_per_repo_counts_only_embedded_texts(tmp_path):
+    embeddings = CachedEmbeddings(HashEmbeddings(), path=str(tmp_path / 'embeddings.sqlite'))
+    db = FAISS(embedding_function=embeddings, index=ann.new_index(16), docstore=MmapDocstore(), index_to_docstore_id={})
+    cached = Document(page_content='README of a/cached', metadata={'repo_name': 'a/cached'})
+    fresh = Document(page_content='README of b/fresh', metadata={'repo_name': 'b/fresh'})
+    embeddings.embed_documents([cached.page_content])
+
+    stats = index(db, [cached, fresh])
+    assert stats['docs'] == 2
+    assert stats['tokens'] == count_tokens(cached.page_content) + count_tokens(fresh.page_content)
+    assert stats['max_tokens_per_repo'] == count_tokens(fresh.page_content)
+    assert stats['tokens_per_repo'] == count_tokens(fresh.page_content) / 2
+    assert embeddings.misses == 2
@@ -0,0 +1,60 @@
+import hashlib
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import ann
+import store
+from mmap_store import MmapDocstore
+
+
+class HashEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return list(np.frombuffer(digest[:16], dtype=np.uint8).astype(np.float32) / 255)
+
+
+def docs(*names):
+    return [Document(page_content=f'README of {name}', metadata={'repo_name': name}) for name in names]
+
+
+def contents(db):
+    return [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(db.index.ntotal)]
+
+
+def test_save_add_save_appends_and_reopens(tmp_path):
+    path = str(tmp_path / 'store')
+    embeddings = HashEmbeddings()
+    db = FAISS(embedding_function=embeddings, index=ann.new_index(16), docstore=MmapDocstore(), index_to_docstore_id={})
+    store.add_documents(db, docs('a/one', 'a/two'))
+    store.save_store(db, path)
+    # the second save appends to the files the first one wrote
+    store.add_documents(db, docs('b/three', 'b/four'))
+    store.save_store(db, path)
+    expected = contents(db)
+    expected_vectors = np.concatenate(store.raw_vectors(db))
+
+    loaded = store.load_store(path, embeddings)
+    assert contents(loaded) == expected
+    np.testing.assert_array_equal(np.concatenate(store.raw_vectors(loaded)), expected_vectors)
+    hits = store.lexical_index(loaded).score_batch(['three'])
+    assert loaded.docstore.search(store.lexical_index(loaded).ids[int(np.argmax(hits[0]))]).metadata['repo_name'] == 'b/three'
+
+    # a store reopened for writing appends too
+    writable = store.load_store(path, embeddings, writable=True)
+    store.add_documents(writable, docs('c/five'))
+    store.save_store(writable, path)
+    reopened = store.load_store(path, embeddings)
+    assert contents(reopened) == expected + ['README of c/five']
+    assert reopened.index.ntotal == 5
+    np.testing.assert_array_equal(
+        np.concatenate(store.raw_vectors(reopened))[:4], expected_vectors
+    )
+    vector = np.asarray([embeddings.embed_query('README of c/five')], dtype=np.float32)
+    _, indices = reopened.index.search(vector, 1)
+    assert contents(reopened)[indices[0][0]] == 'README of c/five'
@@ -1,41 +1,30 @@
-from typing import List, Annotated
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from typing import List, Annotated, Union
 from langchain_community.docstore.document import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.docstore import InMemoryDocstore
-from search import search_github
-from download import load_readme, clone_github_repo
+from search import iter_github, hybrid_search, aggregate_hits, max_pages
+from download import init_db, load_readme, clone_github_repo, embeddings
 from assistant import check_local
-import faiss
-
-embeddings = OpenAIEmbeddings()
+from store import open_store, save_store
+from catalog import get_catalog
 
 def download_readme_to_db(keywords: List[str]) -> Annotated[str, "path of vector database"]:
     keywords = [keyword.lower().strip() for keyword in keywords]
     db_path = check_local(keywords)
-    vector_store = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
     if not db_path:
-        repos = search_github(keywords, 1)
-        vector_store = FAISS(
-                        embedding_function=embeddings,
-                        index=faiss.IndexFlatL2(len(embeddings.embed_query("hello world"))),
-                        docstore=InMemoryDocstore(),
-                        index_to_docstore_id={},
-                    )
-        load_readme(repos, vector_store)
+        vector_store = init_db()
+        # READMEs are fetched while later result pages are still being searched
+        stats = load_readme(iter_github(keywords, max_pages), vector_store)
         db_file_name = '-'.join(keywords).lower()
         db_path = f'./db/{db_file_name}'
-        vector_store.save_local(db_path)
+        save_store(vector_store, db_path)
+        get_catalog().register(keywords, db_path, stats['repos'])
     return db_path
 
-def search_db(db_path: str, text: str) -> List[str]:
-    vector_store = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
-    bm25_retriever = BM25Retriever.from_documents(vector_store.docstore._dict.values())
-    faiss_retriever = vector_store.as_retriever()
-    ensemble_retriever = EnsembleRetriever(
-        retrievers=[bm25_retriever, faiss_retriever], weights=[0.8, 0.2]
-    )
-    similar_repos = ensemble_retriever.invoke(text)
-    return [{"repo_name": repo.metadata["repo_name"], "repo_readme": repo.page_content} for repo in similar_repos]
\ No newline at end of file
+def search_db(db_path: str, text: Union[str, List[str]], k: int = 5) -> List:
+    """Search the store at `db_path` with one README text, or with several variants in a single batched call."""
+    vector_store = open_store(db_path, embeddings)
+    results = hybrid_search(vector_store, text, k=k * 4, weights=(0.8, 0.2), fusion='rrf')
+    def to_json(hits):
+        return [{"repo_name": repo.metadata["repo_name"], "repo_readme": repo.page_content, "score": score} for repo, score in aggregate_hits(hits, k=k)]
+    if isinstance(text, str):
+        return to_json(results)
+    return [to_json(hits) for hits in results]